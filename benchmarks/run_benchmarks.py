@@ -0,0 +1,217 @@
+"""
+Benchmark VOQC passes and the Qiskit pass manager on the bundled circuits.
+
+    python benchmarks/run_benchmarks.py [--repeat N] [--output results.json]
+    python benchmarks/run_benchmarks.py --compare baseline.json [--threshold 0.1]
+
+Every VOQCCircuit pass is timed on tof_10.qasm, tof_3_example.qasm and
+generated Toffoli chains of increasing size; voqc_pass_manager (with and
+without mapping to a line) is timed too when Qiskit is installed. Nothing is
+downloaded. Each sample parses a fresh circuit, which is not counted in the
+pass time. Each case runs in its own forked process, and results record
+latency percentiles, throughput (input gates per second at the median),
+resulting gate counts and how far the case raised the peak RSS above what the
+process used when it started (rss_growth_kb).
+
+With --compare, the new results are checked against a saved baseline and the
+script exits with status 1 if any median time grew by more than the threshold,
+any RSS growth grew by more than the memory threshold, or any resulting gate
+count grew.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyvoqc.bindings import PASSES
+from pyvoqc.cache import library_version
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+
+FILES = { "tof_10" : "pyvoqc/tests/test_qasm_files/tof_10.qasm",
+          "tof_3" : "tutorial-files/tof_3_example.qasm" }
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[%d];\n'
+
+def toffoli_chain(n):
+    # n-controlled NOT computed with n-2 ancillas, as in tof_10.qasm
+    (anc, tgt) = (list(range(n, 2 * n - 2)), 2 * n - 2)
+    ands = [(0, 1, anc[0])] + [(i + 1, anc[i - 1], anc[i]) for i in range(1, n - 2)]
+    gates = ands + [(n - 1, anc[-1], tgt)] + ands[::-1]
+    return HEADER % (2 * n - 1) + "".join("ccx q[%d], q[%d], q[%d];\n" % g for g in gates)
+
+def random_clifford_t(nqbits, ngates, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(ngates):
+        g = rng.choice(["h", "t", "tdg", "s", "x", "cx", "cx", "rz"])
+        if g == "cx":
+            (a, b) = rng.sample(range(nqbits), 2)
+            lines.append("cx q[%d], q[%d];\n" % (a, b))
+        elif g == "rz":
+            lines.append("rz(%f) q[%d];\n" % (rng.uniform(-3, 3), rng.randrange(nqbits)))
+        else:
+            lines.append("%s q[%d];\n" % (g, rng.randrange(nqbits)))
+    return HEADER % nqbits + "".join(lines)
+
+def circuits(scale):
+    out = {}
+    for (name, path) in FILES.items():
+        with open(os.path.join(ROOT, path)) as f:
+            out[name] = f.read()
+    for n in (20, 50, 100 * scale):
+        out["tof_chain_%d" % n] = toffoli_chain(n)
+    out["random_%d" % (5000 * scale)] = random_clifford_t(40, 5000 * scale)
+    return out
+
+def percentile(samples, p):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+def peak_rss_kb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+# Differences in RSS growth below this are noise
+RSS_NOISE_KB = 1024
+
+def isolated(f, *args):
+    # ru_maxrss never decreases, so each case runs in a fresh forked child,
+    # which starts with its high-water mark at the parent's current RSS
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        return pool.apply(_measure, (f,) + args)
+
+def _measure(f, *args):
+    base = peak_rss_kb()
+    result = f(*args)
+    result["rss_growth_kb"] = max(0, peak_rss_kb() - base)
+    return result
+
+def summarize(times, gates_in, gates_out):
+    median = percentile(times, 50)
+    return { "median" : median,
+             "p90" : percentile(times, 90),
+             "min" : min(times),
+             "max" : max(times),
+             "gates_per_sec" : gates_in / median if median > 0 else None,
+             "gates_in" : gates_in,
+             "gates_out" : gates_out }
+
+def bench_pass(qasm, name, repeat):
+    lib = get_library_handle()
+    times = []
+    for _ in range(repeat):
+        with VOQCCircuit.from_qasm_string(lib, qasm) as c:
+            gates_in = c.total_gate_count()
+            f = getattr(c, name)
+            start = time.perf_counter()
+            f()
+            times.append(time.perf_counter() - start)
+            gates_out = c.total_gate_count()
+    return summarize(times, gates_in, gates_out)
+
+def bench_pass_manager(qasm, repeat, mapped):
+    from qiskit import QuantumCircuit
+    from qiskit.transpiler import CouplingMap
+    from pyvoqc.qiskit import voqc_pass_manager
+
+    circ = QuantumCircuit.from_qasm_str(qasm)
+    coupling_map = CouplingMap.from_line(circ.num_qubits) if mapped else None
+    times = []
+    for _ in range(repeat):
+        pm = voqc_pass_manager(coupling_map=coupling_map, seed_transpiler=0)
+        start = time.perf_counter()
+        out = pm.run(circ)
+        times.append(time.perf_counter() - start)
+    return summarize(times, circ.size(), out.size())
+
+def run(args):
+    # load the library before forking, so the cases do not pay for it
+    get_library_handle()
+    try:
+        import qiskit
+        have_qiskit = True
+    except ImportError:
+        print("Qiskit is not installed; skipping voqc_pass_manager cases.", file=sys.stderr)
+        have_qiskit = False
+
+    results = {}
+    for (cname, qasm) in circuits(args.scale).items():
+        for p in PASSES:
+            results["%s/%s" % (cname, p)] = isolated(bench_pass, qasm, p, args.repeat)
+            report(cname, p, results["%s/%s" % (cname, p)])
+        if have_qiskit:
+            for (label, mapped) in (("pass_manager", False), ("pass_manager_line", True)):
+                # mapping the largest circuits takes minutes in Qiskit
+                if mapped and qasm.count("\n") > 2000:
+                    continue
+                results["%s/%s" % (cname, label)] = isolated(bench_pass_manager, qasm, args.repeat, mapped)
+                report(cname, label, results["%s/%s" % (cname, label)])
+
+    return { "meta" : { "python" : platform.python_version(),
+                        "platform" : platform.platform(),
+                        "library_version" : library_version(),
+                        "repeat" : args.repeat,
+                        "scale" : args.scale,
+                        "peak_rss_kb" : peak_rss_kb() },
+             "results" : results }
+
+def report(cname, name, r):
+    print("%-24s %-28s %10.3f ms  p90 %10.3f ms  %8d -> %-8d gates  +%d KB RSS" %
+          (cname, name, r["median"] * 1000, r["p90"] * 1000, r["gates_in"], r["gates_out"], r["rss_growth_kb"]))
+
+def compare(baseline, current, threshold, memory_threshold=0.2):
+    """Return a list of regression messages (empty if there are none)."""
+    problems = []
+    for (key, old) in baseline["results"].items():
+        new = current["results"].get(key)
+        if new is None:
+            continue
+        if new["median"] > old["median"] * (1 + threshold):
+            problems.append("%s: median %.3f ms -> %.3f ms (+%.0f%%)" %
+                            (key, old["median"] * 1000, new["median"] * 1000,
+                             100 * (new["median"] / old["median"] - 1)))
+        (old_rss, new_rss) = (old.get("rss_growth_kb"), new.get("rss_growth_kb"))
+        if old_rss is not None and new_rss > old_rss * (1 + memory_threshold) and new_rss - old_rss > RSS_NOISE_KB:
+            problems.append("%s: RSS growth %d KB -> %d KB" % (key, old_rss, new_rss))
+        if new["gates_out"] > old["gates_out"]:
+            problems.append("%s: output gates %d -> %d" % (key, old["gates_out"], new["gates_out"]))
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="samples per case")
+    parser.add_argument("--scale", type=int, default=2, help="size factor for the generated circuits")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed relative slowdown before a case is flagged (default 0.1)")
+    parser.add_argument("--memory-threshold", type=float, default=0.2,
+                        help="allowed relative growth in a case's peak RSS (default 0.2)")
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(baseline, current, args.threshold, args.memory_threshold)
+        for msg in problems:
+            print("REGRESSION " + msg)
+        if problems:
+            sys.exit(1)
+        print("No regressions against %s." % args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure pyvoqc startup costs in fresh interpreters.
+
+    python benchmarks/startup.py [--repeat N]
+
+Each sample runs in a new Python process so that library loading and OCaml
+runtime initialization are measured cold. Reported times are medians in ms.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Each snippet prints a JSON dict of stage -> seconds
+SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import pyvoqc.voqc
+t1 = time.perf_counter()
+from pyvoqc.voqc import get_library_handle
+get_library_handle()
+t2 = time.perf_counter()
+get_library_handle()
+t3 = time.perf_counter()
+import pyvoqc.qiskit
+t4 = time.perf_counter()
+out = { "import pyvoqc.voqc" : t1 - t0,
+        "first get_library_handle" : t2 - t1,
+        "cached get_library_handle" : t3 - t2,
+        "import pyvoqc.qiskit (lazy)" : t4 - t3 }
+if %(qiskit)s:
+    pyvoqc.qiskit.voqc_pass_manager
+    out["first use of pyvoqc.qiskit"] = time.perf_counter() - t4
+print(json.dumps(out))
+"""
+
+def sample(with_qiskit):
+    out = subprocess.run([sys.executable, "-c", SNIPPET % { "qiskit" : with_qiskit }],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="number of fresh processes")
+    parser.add_argument("--no-qiskit", action="store_true", help="skip timing the Qiskit import")
+    args = parser.parse_args()
+
+    samples = [sample(not args.no_qiskit) for _ in range(args.repeat)]
+    for stage in samples[0]:
+        ms = statistics.median(s[stage] for s in samples) * 1000
+        print("%-32s %10.3f ms" % (stage, ms))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,244 @@
 open Voqc.Qasm
 open Voqc.Main
+open Voqc.UnitaryListRepresentation
+open Voqc.FullGateSet.FullGateSet
+
+(* Binary gate records, used to move circuits in and out of VOQC without
+   printing and parsing QASM. A circuit of n gates is stored as an int array
+   of length 4n (opcode, then up to three qubit arguments) and a float array
+   of length 3n (up to three parameters). Opcodes follow the order of the
+   count_* functions below. The parameter of Rzq is the rational q in Rz(q * PI),
+   stored as a float (see rzq_params for the exact value). *)
+let record_of_gate g =
+  match g with
+  | App1 (U_I, q) -> (0, [q], [])
+  | App1 (U_X, q) -> (1, [q], [])
+  | App1 (U_Y, q) -> (2, [q], [])
+  | App1 (U_Z, q) -> (3, [q], [])
+  | App1 (U_H, q) -> (4, [q], [])
+  | App1 (U_S, q) -> (5, [q], [])
+  | App1 (U_T, q) -> (6, [q], [])
+  | App1 (U_Sdg, q) -> (7, [q], [])
+  | App1 (U_Tdg, q) -> (8, [q], [])
+  | App1 (U_Rx a, q) -> (9, [q], [a])
+  | App1 (U_Ry a, q) -> (10, [q], [a])
+  | App1 (U_Rz a, q) -> (11, [q], [a])
+  | App1 (U_Rzq a, q) -> (12, [q], [Q.to_float a])
+  | App1 (U_U1 a, q) -> (13, [q], [a])
+  | App1 (U_U2 (a, b), q) -> (14, [q], [a; b])
+  | App1 (U_U3 (a, b, c), q) -> (15, [q], [a; b; c])
+  | App2 (U_CX, q1, q2) -> (16, [q1; q2], [])
+  | App2 (U_CZ, q1, q2) -> (17, [q1; q2], [])
+  | App2 (U_SWAP, q1, q2) -> (18, [q1; q2], [])
+  | App3 (U_CCX, q1, q2, q3) -> (19, [q1; q2; q3], [])
+  | App3 (U_CCZ, q1, q2, q3) -> (20, [q1; q2; q3], [])
+  | _ -> failwith "record_of_gate: invalid gate"
+
+let circ_to_records c =
+  let n = List.length c in
+  let ints = Array.make (4 * n) 0 in
+  let floats = Array.make (3 * n) 0.0 in
+  List.iteri (fun i g ->
+      let (op, qs, ps) = record_of_gate g in
+      ints.(4 * i) <- op;
+      List.iteri (fun j q -> ints.(4 * i + 1 + j) <- q) qs;
+      List.iteri (fun j p -> floats.(3 * i + j) <- p) ps) c;
+  (ints, floats)
+
+let gate_of_record ints floats i =
+  let q j = ints.(4 * i + 1 + j) in
+  let p j = floats.(3 * i + j) in
+  match ints.(4 * i) with
+  | 0 -> App1 (U_I, q 0)
+  | 1 -> App1 (U_X, q 0)
+  | 2 -> App1 (U_Y, q 0)
+  | 3 -> App1 (U_Z, q 0)
+  | 4 -> App1 (U_H, q 0)
+  | 5 -> App1 (U_S, q 0)
+  | 6 -> App1 (U_T, q 0)
+  | 7 -> App1 (U_Sdg, q 0)
+  | 8 -> App1 (U_Tdg, q 0)
+  | 9 -> App1 (U_Rx (p 0), q 0)
+  | 10 -> App1 (U_Ry (p 0), q 0)
+  | 11 -> App1 (U_Rz (p 0), q 0)
+  | 12 -> App1 (U_Rzq (Q.of_float (p 0)), q 0)
+  | 13 -> App1 (U_U1 (p 0), q 0)
+  | 14 -> App1 (U_U2 (p 0, p 1), q 0)
+  | 15 -> App1 (U_U3 (p 0, p 1, p 2), q 0)
+  | 16 -> App2 (U_CX, q 0, q 1)
+  | 17 -> App2 (U_CZ, q 0, q 1)
+  | 18 -> App2 (U_SWAP, q 0, q 1)
+  | 19 -> App3 (U_CCX, q 0, q 1, q 2)
+  | 20 -> App3 (U_CCZ, q 0, q 1, q 2)
+  | _ -> failwith "gate_of_record: invalid opcode"
+
+let circ_of_records ints floats =
+  List.init (Array.length ints / 4) (gate_of_record ints floats)
+
+(* The records only hold Rzq parameters as floats. rzq_params returns the
+   exact rationals of the Rzq gates, in circuit order, separated by spaces;
+   set_rzq_params puts such a list back into a circuit built from records. *)
+let rzq_params c =
+  String.concat " " (List.rev (List.fold_left (fun acc g ->
+      match g with App1 (U_Rzq q, _) -> Q.to_string q :: acc | _ -> acc) [] c))
+
+let set_rzq_params c s =
+  let qs = ref (List.filter (fun w -> w <> "") (String.split_on_char ' ' s)) in
+  let c' = List.rev (List.rev_map (fun g ->
+      match (g, !qs) with
+      | (App1 (U_Rzq _, n), q :: rest) -> qs := rest; App1 (U_Rzq (Q.of_string q), n)
+      | (App1 (U_Rzq _, _), []) -> failwith "set_rzq_params: too few parameters"
+      | _ -> g) c) in
+  if !qs <> [] then failwith "set_rzq_params: too many parameters";
+  c'
+
+(* All gate statistics in one traversal: the 21 per-gate counts (in opcode
+   order), then the total gate count, then the number of Rzq gates that are
+   Clifford (i.e. Rz(q * PI) where q is a multiple of 1/2). *)
+let count_all c =
+  let counts = Array.make 23 0 in
+  let two = Q.of_int 2 in
+  List.iter (fun g ->
+      let (op, _, _) = record_of_gate g in
+      counts.(op) <- counts.(op) + 1;
+      match g with
+      | App1 (U_Rzq q, _) when Z.equal (Q.den (Q.mul q two)) Z.one ->
+          counts.(22) <- counts.(22) + 1
+      | _ -> ()) c;
+  counts.(21) <- List.length c;
+  counts
+
+(* Circuit analytics in one traversal, packed into a single int array:
+     nqbits, depth, multi-qubit depth, critical path length, number of edges,
+     then per qubit (nqbits entries each): gate count, multi-qubit gate count
+     and depth, then the indices of the gates on one critical path (in
+     circuit order), then the interaction graph as (q1, q2, count) triples
+     with q1 < q2, sorted. *)
+let analyze c nqbits =
+  let n = List.length c in
+  let level = Array.make nqbits 0 in
+  let level2 = Array.make nqbits 0 in
+  let last = Array.make nqbits (-1) in
+  let count = Array.make nqbits 0 in
+  let count2 = Array.make nqbits 0 in
+  let glevel = Array.make n 0 in
+  let pred = Array.make n (-1) in
+  let edges = Hashtbl.create 64 in
+  let add_edge a b =
+    let k = (min a b, max a b) in
+    Hashtbl.replace edges k (1 + (try Hashtbl.find edges k with Not_found -> 0)) in
+  List.iteri (fun i g ->
+      let (_, qs, _) = record_of_gate g in
+      let multi = List.length qs > 1 in
+      (* the gate follows the latest gate on any of its qubits *)
+      let (l, p) = List.fold_left (fun (l, p) q ->
+          if level.(q) > l then (level.(q), last.(q)) else (l, p)) (0, -1) qs in
+      let l2 = List.fold_left (fun m q -> max m level2.(q)) 0 qs + (if multi then 1 else 0) in
+      glevel.(i) <- l + 1;
+      pred.(i) <- p;
+      List.iter (fun q ->
+          level.(q) <- l + 1;
+          level2.(q) <- l2;
+          last.(q) <- i;
+          count.(q) <- count.(q) + 1;
+          if multi then count2.(q) <- count2.(q) + 1) qs;
+      (match qs with
+       | [a; b] -> add_edge a b
+       | [a; b; d] -> add_edge a b; add_edge a d; add_edge b d
+       | _ -> ())) c;
+  let depth = Array.fold_left max 0 level in
+  let depth2 = Array.fold_left max 0 level2 in
+  let crit =
+    if n = 0 then [] else begin
+      let last_gate = ref 0 in
+      Array.iteri (fun i l -> if l > glevel.(!last_gate) then last_gate := i) glevel;
+      let rec back i acc = if i < 0 then acc else back pred.(i) (i :: acc) in
+      back !last_gate []
+    end in
+  let es = List.sort compare (Hashtbl.fold (fun (a, b) k acc -> (a, b, k) :: acc) edges []) in
+  Array.concat
+    [ [| nqbits; depth; depth2; List.length crit; List.length es |];
+      count; count2; level;
+      Array.of_list crit;
+      Array.of_list (List.concat (List.map (fun (a, b, k) -> [a; b; k]) es)) ]
+
+(* Passes that can be used in run_pipeline, by VOQCCircuit method name *)
+let pass_of_name name =
+  match name with
+  | "convert_to_rzq" -> convert_to_rzq
+  | "convert_to_ibm" -> convert_to_ibm
+  | "decompose_to_cnot" -> decompose_to_cnot
+  | "replace_rzq" -> replace_rzq
+  | "optimize_ibm" -> optimize_ibm
+  | "not_propagation" -> not_propagation
+  | "hadamard_reduction" -> hadamard_reduction
+  | "cancel_single_qubit_gates" -> cancel_single_qubit_gates
+  | "cancel_two_qubit_gates" -> cancel_two_qubit_gates
+  | "merge_rotations" -> merge_rotations
+  | "optimize_nam" | "optimize" -> optimize_nam
+  | _ -> failwith ("pass_of_name: unknown pass " ^ name)
+
+(* Apply a sequence of passes. In fixpoint mode the whole sequence is repeated
+   until the gate count stops decreasing or max_rounds rounds have run
+   (max_rounds <= 0 means no limit). Returns the final circuit and the number
+   of rounds run. *)
+let run_pipeline c names fixpoint max_rounds =
+  let passes = List.map pass_of_name names in
+  let run_once c = List.fold_left (fun c p -> p c) c passes in
+  let rec loop c n rounds =
+    let c' = run_once c in
+    let n' = List.length c' in
+    if fixpoint && n' < n && (max_rounds <= 0 || rounds + 1 < max_rounds)
+    then loop c' n' (rounds + 1)
+    else (c', rounds + 1) in
+  loop c (List.length c) 0
+
+(* Splitting and joining gate lists, for incremental optimization. All three
+   are tail recursive; circ_drop shares the suffix instead of copying it. *)
+let circ_append c1 c2 = List.rev_append (List.rev c1) c2
+
+let circ_take c n =
+  let rec go n acc l =
+    if n <= 0 then List.rev acc
+    else match l with [] -> List.rev acc | g :: l' -> go (n - 1) (g :: acc) l' in
+  go n [] c
+
+let rec circ_drop c n =
+  if n <= 0 then c else match c with [] -> [] | _ :: c' -> circ_drop c' (n - 1)
+
+(* Verified layout and routing. simple_map returns the mapped circuit (which
+   may contain SWAPs, see decompose_swaps) and the final layout. *)
+let layout_to_array la n = Array.of_list (layout_to_list la n)
+
+(* OCaml heap statistics for the Python side, from Gc.quick_stat (which does
+   not walk the heap): heap_words, top_heap_words, minor_collections,
+   major_collections, compactions, minor_words, promoted_words, major_words *)
+let gc_stats () =
+  let s = Gc.quick_stat () in
+  [| s.Gc.heap_words; s.Gc.top_heap_words; s.Gc.minor_collections;
+     s.Gc.major_collections; s.Gc.compactions; int_of_float s.Gc.minor_words;
+     int_of_float s.Gc.promoted_words; int_of_float s.Gc.major_words |]
+
+(* Current GC parameters: minor_heap_size (in words), space_overhead *)
+let gc_params () =
+  let c = Gc.get () in
+  [| c.Gc.minor_heap_size; c.Gc.space_overhead |]
+
+(* Arguments <= 0 leave the corresponding parameter unchanged *)
+let gc_set minor_heap_size space_overhead =
+  let c = Gc.get () in
+  Gc.set { c with
+    Gc.minor_heap_size = (if minor_heap_size > 0 then minor_heap_size else c.Gc.minor_heap_size);
+    Gc.space_overhead = (if space_overhead > 0 then space_overhead else c.Gc.space_overhead) }
+
+let gc_compact () = Gc.compact ()
 
 let () = Callback.register "read_qasm" read_qasm
 let () = Callback.register "write_qasm" write_qasm
+let () = Callback.register "circ_to_records" circ_to_records
+let () = Callback.register "circ_of_records" circ_of_records
+let () = Callback.register "rzq_params" rzq_params
+let () = Callback.register "set_rzq_params" set_rzq_params
 
 let ()  = Callback.register "count_I" count_I
 let ()  = Callback.register "count_X" count_X
@@ -27,6 +263,8 @@ let ()  = Callback.register "count_CCX" count_CCX
 let ()  = Callback.register "count_CCZ" count_CCZ
 let ()  = Callback.register "count_total" count_total
 let ()  = Callback.register "count_rzq_clifford" count_rzq_clifford
+let ()  = Callback.register "count_all" count_all
+let ()  = Callback.register "analyze" analyze
 
 let () = Callback.register "check_well_typed" check_well_typed
 let () = Callback.register "convert_to_rzq" convert_to_rzq
@@ -42,6 +280,10 @@ let () = Callback.register "cancel_two_qubit_gates" cancel_two_qubit_gates
 let () = Callback.register "merge_rotations" merge_rotations
 let () = Callback.register "optimize_nam" optimize_nam
 let () = Callback.register "optimize" optimize_nam
+let () = Callback.register "run_pipeline" run_pipeline
+let () = Callback.register "circ_append" circ_append
+let () = Callback.register "circ_take" circ_take
+let () = Callback.register "circ_drop" circ_drop
 
 let () = Callback.register "decompose_swaps" decompose_swaps
 let () = Callback.register "trivial_layout" trivial_layout
@@ -49,4 +291,12 @@ let () = Callback.register "check_list" check_list
 let () = Callback.register "list_to_layout" list_to_layout
 let () = Callback.register "c_graph_from_coupling_map" c_graph_from_coupling_map
 let () = Callback.register "check_swap_equivalence" check_swap_equivalence
-let () = Callback.register "check_constraints" check_constraints
\ No newline at end of file
+let () = Callback.register "check_constraints" check_constraints
+let () = Callback.register "greedy_layout" greedy_layout
+let () = Callback.register "simple_map" simple_map
+let () = Callback.register "layout_to_list" layout_to_array
+
+let () = Callback.register "gc_stats" gc_stats
+let () = Callback.register "gc_params" gc_params
+let () = Callback.register "gc_set" gc_set
+let () = Callback.register "gc_compact" gc_compact
\ No newline at end of file
@@ -1,5 +1,9 @@
+#define _GNU_SOURCE
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <unistd.h>
+#include <sys/mman.h>
 #include <caml/mlvalues.h>
 #include <caml/alloc.h>
 #include <caml/memory.h>
@@ -49,6 +53,11 @@ void destroy(value* v) {
     free(v);
 }
 
+// Register a second root for the same (immutable) OCaml value
+value* copy_root(value* v) {
+    return wrap(*v);
+}
+
 void init () {
     static char* dummy_argv[2] = { "", NULL };
     caml_startup(dummy_argv);
@@ -67,13 +76,15 @@ void init () {
 
 // TODO: Why are we using value* instead of value everywhere? (I don't remember) -KH
 
+// Returns a circuit with circ == NULL if the file cannot be read or parsed
 CircIntPair read_qasm (char* fname) {
    CAMLparam0();
    CAMLlocal2(local, res);
    local = caml_copy_string(fname);
    CLOSURE("read_qasm");
-   res = caml_callback(*closure, local);
-   CircIntPair retval;
+   res = caml_callback_exn(*closure, local);
+   CircIntPair retval = { NULL, 0 };
+   if (Is_exception_result(res)) CAMLreturnT(CircIntPair, retval);
    retval.circ = wrap (Field (res, 0)); 
    retval.nqbits = Int_val (Field (res, 1));
    CAMLreturnT(CircIntPair, retval);
@@ -88,6 +99,180 @@ void write_qasm (value* circ, int nqbits, char* outf) {
    CAMLreturn0;
 }
 
+// The VOQC parser and printer only work on file names, so the string-based
+// I/O functions below go through a private scratch file. On Linux this is an
+// anonymous in-memory file (memfd_create) reached through /proc/self/fd, so
+// nothing touches the disk. Elsewhere we fall back to a file from mkstemp.
+typedef struct scratch
+{
+  int fd;
+  int unlink;
+  char path[512];
+} Scratch ;
+
+static int open_scratch (Scratch* s) {
+#if defined(__linux__) && defined(MFD_CLOEXEC)
+   s->fd = memfd_create("voqc", MFD_CLOEXEC);
+   if (s->fd >= 0) {
+      snprintf(s->path, sizeof(s->path), "/proc/self/fd/%d", s->fd);
+      s->unlink = 0;
+      return 0;
+   }
+#endif
+   const char* dir = getenv("TMPDIR");
+   snprintf(s->path, sizeof(s->path), "%s/voqc_XXXXXX", dir ? dir : "/tmp");
+   s->fd = mkstemp(s->path);
+   s->unlink = 1;
+   return (s->fd >= 0) ? 0 : -1;
+}
+
+static void close_scratch (Scratch* s) {
+   close(s->fd);
+   if (s->unlink) unlink(s->path);
+}
+
+// Returns a circuit with circ == NULL if the scratch file could not be created
+// or the QASM could not be parsed
+CircIntPair read_qasm_string (char* buff, int len) {
+   CircIntPair retval = { NULL, 0 };
+   Scratch s;
+   if (open_scratch(&s) < 0) return retval;
+   int done = 0;
+   while (done < len) {
+      ssize_t n = write(s.fd, buff + done, len - done);
+      if (n <= 0) {
+         close_scratch(&s);
+         return retval;
+      }
+      done += n;
+   }
+   retval = read_qasm(s.path);
+   close_scratch(&s);
+   return retval;
+}
+
+// The returned buffer is allocated with malloc and must be released with
+// free_buffer. Returns NULL if the scratch file could not be created or read.
+char* write_qasm_string (value* circ, int nqbits, int* len) {
+   Scratch s;
+   *len = 0;
+   if (open_scratch(&s) < 0) return NULL;
+   write_qasm(circ, nqbits, s.path);
+   off_t size = lseek(s.fd, 0, SEEK_END);
+   char* out = (size < 0) ? NULL : (char*) malloc(size + 1);
+   off_t done = 0;
+   while (out && done < size) {
+      ssize_t n = pread(s.fd, out + done, size - done, done);
+      if (n <= 0) {
+         free(out);
+         out = NULL;
+      }
+      else done += n;
+   }
+   close_scratch(&s);
+   if (out) {
+      out[size] = '\0';
+      *len = (int) size;
+   }
+   return out;
+}
+
+void free_buffer (char* buff) {
+   free(buff);
+}
+
+// Number of qubit arguments for each opcode in GateRecord
+static const int record_arity[] = { 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 
+                                    1, 1, 1, 1, 1, 2, 2, 2, 3, 3 };
+
+// Returns a circuit with circ == NULL if any record is malformed
+CircIntPair circ_from_records (int nqbits, int len, GateRecord* buff) {
+   CAMLparam0();
+   CAMLlocal3(ints, floats, res);
+   CircIntPair retval = { NULL, nqbits };
+   int i;
+   for (i = 0; i < len; i++)
+   {
+      int op = buff[i].op;
+      if (op < 0 || op > 20) CAMLreturnT(CircIntPair, retval);
+      int qs[3] = { buff[i].q0, buff[i].q1, buff[i].q2 };
+      int j;
+      for (j = 0; j < record_arity[op]; j++)
+         if (qs[j] < 0 || qs[j] >= nqbits) CAMLreturnT(CircIntPair, retval);
+   }
+   ints = caml_alloc(4 * len, 0);
+   floats = caml_alloc(3 * len * Double_wosize, Double_array_tag);
+   for (i = 0; i < len; i++)
+   {
+      Store_field(ints, 4 * i, Val_int(buff[i].op));
+      Store_field(ints, 4 * i + 1, Val_int(buff[i].q0));
+      Store_field(ints, 4 * i + 2, Val_int(buff[i].q1));
+      Store_field(ints, 4 * i + 3, Val_int(buff[i].q2));
+      Store_double_field(floats, 3 * i, buff[i].a0);
+      Store_double_field(floats, 3 * i + 1, buff[i].a1);
+      Store_double_field(floats, 3 * i + 2, buff[i].a2);
+   }
+   CLOSURE("circ_of_records");
+   res = caml_callback2(*closure, ints, floats);
+   retval.circ = wrap(res);
+   CAMLreturnT(CircIntPair, retval);
+}
+
+// buff is allocated in the Python code with len entries (the total gate count).
+// Returns the number of records written, or -1 if buff is too small.
+int circ_to_records (value* circ, int len, GateRecord* buff) {
+   CAMLparam0();
+   CAMLlocal3(res, ints, floats);
+   CLOSURE("circ_to_records");
+   res = caml_callback(*closure, *circ);
+   ints = Field(res, 0);
+   floats = Field(res, 1);
+   int n = Wosize_val(ints) / 4;
+   if (n > len) CAMLreturnT(int, -1);
+   int i;
+   for (i = 0; i < n; i++)
+   {
+      buff[i].op = Int_val(Field(ints, 4 * i));
+      buff[i].q0 = Int_val(Field(ints, 4 * i + 1));
+      buff[i].q1 = Int_val(Field(ints, 4 * i + 2));
+      buff[i].q2 = Int_val(Field(ints, 4 * i + 3));
+      buff[i].a0 = Double_field(floats, 3 * i);
+      buff[i].a1 = Double_field(floats, 3 * i + 1);
+      buff[i].a2 = Double_field(floats, 3 * i + 2);
+   }
+   CAMLreturnT(int, n);
+}
+
+// Exact Rzq parameters (see libvoqc.ml). The returned buffer is allocated
+// with malloc and must be released with free_buffer; NULL if out of memory.
+char* rzq_params (value* circ, int* len) {
+   CAMLparam0();
+   CAMLlocal1(res);
+   CLOSURE("rzq_params");
+   res = caml_callback(*closure, *circ);
+   int n = caml_string_length(res);
+   char* out = (char*) malloc(n + 1);
+   *len = 0;
+   if (out) {
+      memcpy(out, String_val(res), n);
+      out[n] = '\0';
+      *len = n;
+   }
+   CAMLreturnT(char*, out);
+}
+
+// Returns NULL if buff does not hold one rational per Rzq gate
+value* set_rzq_params (value* circ, char* buff, int len) {
+   CAMLparam0();
+   CAMLlocal2(local, res);
+   local = caml_alloc_string(len);
+   memcpy((char*) String_val(local), buff, len);
+   CLOSURE("set_rzq_params");
+   res = caml_callback2_exn(*closure, *circ, local);
+   if (Is_exception_result(res)) CAMLreturnT(value*, NULL);
+   CAMLreturnT(value*, wrap(res));
+}
+
 int count_I (value* circ) {
    CLOSURE("count_I");
    return Int_val(caml_callback(*closure, *circ));
@@ -203,6 +388,35 @@ int count_rzq_clifford (value* circ) {
    return Int_val(caml_callback(*closure, *circ));
 }
 
+// buff is allocated in the Python code with 23 entries: the counts for each
+// gate (in the order above), the total gate count and the Clifford Rzq count
+void count_all (value* circ, int* buff) {
+   CAMLparam0();
+   CAMLlocal1(res);
+   CLOSURE("count_all");
+   res = caml_callback(*closure, *circ);
+   int i;
+   for (i = 0; i < 23; i++) buff[i] = Int_val(Field(res, i));
+   CAMLreturn0;
+}
+
+// Returns a root for the OCaml int array built by analyze in libvoqc.ml and
+// its length; copy it out with blit_ints, then destroy the root.
+value* analyze (value* circ, int nqbits, int* len) {
+   CAMLparam0();
+   CAMLlocal1(res);
+   CLOSURE("analyze");
+   res = caml_callback2(*closure, *circ, Val_int(nqbits));
+   *len = Wosize_val(res);
+   CAMLreturnT(value*, wrap(res));
+}
+
+// buff is allocated in the Python code with the array's length
+void blit_ints (value* arr, int* buff) {
+   int i, n = Wosize_val(*arr);
+   for (i = 0; i < n; i++) buff[i] = Int_val(Field(*arr, i));
+}
+
 int check_well_typed (value* circ, int nqbits) {
     CLOSURE("check_well_typed");
     return Bool_val(caml_callback2(*closure, *circ, Val_int(nqbits)));
@@ -256,6 +470,57 @@ value* optimize (value* circ) {
    RUNOPT("optimize", circ);
 }
 
+// names is an array of npasses pass names (see pass_of_name in libvoqc.ml).
+// rounds is set to the number of times the sequence was applied.
+value* run_pipeline (value* circ, int npasses, char** names, int fixpoint, int max_rounds, int* rounds) {
+    CAMLparam0();
+    CAMLlocal4(res, cons, lst, name);
+    CAMLlocalN(args, 4);
+    int i;
+    for (i = npasses - 1; i >= 0; i--) // build the list "backwards"
+    {
+        name = caml_copy_string(names[i]);
+        cons = caml_alloc(2, 0);
+        Store_field(cons, 0, name); // head
+        Store_field(cons, 1, lst);  // tail
+        lst = cons;
+    }
+    CLOSURE("run_pipeline");
+    args[0] = *circ;
+    args[1] = lst;
+    args[2] = Val_bool(fixpoint);
+    args[3] = Val_int(max_rounds);
+    res = caml_callbackN(*closure, 4, args);
+    *rounds = Int_val(Field(res, 1));
+    destroy(circ);
+    CAMLreturnT(value*, wrap(Field(res, 0)));
+}
+
+// Unlike the passes, these do not destroy their arguments
+value* circ_append (value* circ1, value* circ2) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("circ_append");
+    res = caml_callback2(*closure, *circ1, *circ2);
+    CAMLreturnT(value*, wrap(res));
+}
+
+value* circ_take (value* circ, int n) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("circ_take");
+    res = caml_callback2(*closure, *circ, Val_int(n));
+    CAMLreturnT(value*, wrap(res));
+}
+
+value* circ_drop (value* circ, int n) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("circ_drop");
+    res = caml_callback2(*closure, *circ, Val_int(n));
+    CAMLreturnT(value*, wrap(res));
+}
+
 value* decompose_swaps(value* circ, value* c_graph) {
     CAMLparam0();
     CAMLlocal1(res);
@@ -320,7 +585,7 @@ value* c_graph_from_coupling_map(int nqbits, int len, IntIntPair* coupling_map)
         lst = cons;
     }
     CLOSURE("c_graph_from_coupling_map");
-    res = caml_callback2(*closure, nqbits, lst);
+    res = caml_callback2(*closure, Val_int(nqbits), lst);
     CAMLreturnT(value*, wrap(res));
 }
 
@@ -338,4 +603,67 @@ int check_swap_equivalence (value* circ1, value* circ2, value* layout1, value* l
 int check_constraints (value* circ, value* c_graph) {
     CLOSURE("check_constraints");
     return Bool_val(caml_callback2(*closure, *circ, *c_graph));
+}
+
+value* greedy_layout (value* circ, value* c_graph) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("greedy_layout");
+    res = caml_callback2(*closure, *circ, *c_graph);
+    CAMLreturnT(value*, wrap(res));
+}
+
+// Like the passes, destroys circ. The final layout is returned through
+// final_layout as a new root.
+value* simple_map (value* circ, value* layout, value* c_graph, value** final_layout) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("simple_map");
+    res = caml_callback3(*closure, *circ, *layout, *c_graph);
+    destroy(circ);
+    *final_layout = wrap(Field(res, 1));
+    CAMLreturnT(value*, wrap(Field(res, 0)));
+}
+
+// buff is allocated in the Python code with nqbits entries
+void layout_to_list (value* layout, int nqbits, int* buff) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("layout_to_list");
+    res = caml_callback2(*closure, *layout, Val_int(nqbits));
+    int i;
+    for (i = 0; i < nqbits && i < (int) Wosize_val(res); i++) buff[i] = Int_val(Field(res, i));
+    CAMLreturn0;
+}
+
+// buff is allocated in the Python code with 8 entries (see gc_stats in libvoqc.ml)
+void gc_stats (long* buff) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("gc_stats");
+    res = caml_callback(*closure, Val_unit);
+    int i;
+    for (i = 0; i < 8; i++) buff[i] = Long_val(Field(res, i));
+    CAMLreturn0;
+}
+
+// buff is allocated in the Python code with 2 entries
+void gc_params (long* buff) {
+    CAMLparam0();
+    CAMLlocal1(res);
+    CLOSURE("gc_params");
+    res = caml_callback(*closure, Val_unit);
+    buff[0] = Long_val(Field(res, 0));
+    buff[1] = Long_val(Field(res, 1));
+    CAMLreturn0;
+}
+
+void gc_set (long minor_heap_size, long space_overhead) {
+    CLOSURE("gc_set");
+    caml_callback2(*closure, Val_long(minor_heap_size), Val_long(space_overhead));
+}
+
+void gc_compact () {
+    CLOSURE("gc_compact");
+    caml_callback(*closure, Val_unit);
 }
\ No newline at end of file
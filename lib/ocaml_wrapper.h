@@ -2,6 +2,7 @@
 
 void init();
 void destroy(value*);
+value* copy_root(value*);
 
 typedef struct circ_int_pair
 {
@@ -15,9 +16,29 @@ typedef struct int_int_pair
   int y;
 } IntIntPair ;
 
+// op is an index into the gate list used by the count_* functions; unused
+// qubit and parameter fields are ignored
+typedef struct gate_record
+{
+  int op;
+  int q0;
+  int q1;
+  int q2;
+  double a0;
+  double a1;
+  double a2;
+} GateRecord ;
+
 // I/O 
 CircIntPair read_qasm(char* fname);
 void write_qasm(value* circ, int nqbits, char* outf);
+CircIntPair read_qasm_string(char* buff, int len);
+char* write_qasm_string(value* circ, int nqbits, int* len);
+void free_buffer(char* buff);
+CircIntPair circ_from_records(int nqbits, int len, GateRecord* buff);
+int circ_to_records(value* circ, int len, GateRecord* buff);
+char* rzq_params(value* circ, int* len);
+value* set_rzq_params(value* circ, char* buff, int len);
 
 // Utility
 int count_I(value* circ);
@@ -43,6 +64,9 @@ int count_CCX(value* circ);
 int count_CCZ(value* circ);
 int count_total(value* circ);
 int count_rzq_clifford(value* circ);
+void count_all(value* circ, int* buff);
+value* analyze(value* circ, int nqbits, int* len);
+void blit_ints(value* arr, int* buff);
 int check_well_typed(value* circ, int nqbits);
 value* convert_to_rzq(value* circ);
 value* convert_to_ibm(value* circ);
@@ -58,6 +82,10 @@ value* cancel_two_qubit_gates(value* circ);
 value* merge_rotations(value* circ);
 value* optimize_nam(value* circ);
 value* optimize(value* circ);
+value* run_pipeline(value* circ, int npasses, char** names, int fixpoint, int max_rounds, int* rounds);
+value* circ_append(value* circ1, value* circ2);
+value* circ_take(value* circ, int n);
+value* circ_drop(value* circ, int n);
 
 // Mapping
 value* decompose_swaps(value* circ, value* c_graph);
@@ -66,4 +94,13 @@ int check_list(int nqbits, int* buff);
 value* list_to_layout(int nqbits, int* buff);
 value* c_graph_from_coupling_map(int nqbits, int len, IntIntPair* coupling_map);
 int check_swap_equivalence(value* circ1, value* circ2, value* layout1, value* layout2);
-int check_constraints(value* circ, value* c_graph);
\ No newline at end of file
+int check_constraints(value* circ, value* c_graph);
+value* greedy_layout(value* circ, value* c_graph);
+value* simple_map(value* circ, value* layout, value* c_graph, value** final_layout);
+void layout_to_list(value* layout, int nqbits, int* buff);
+
+// OCaml runtime
+void gc_stats(long* buff);
+void gc_params(long* buff);
+void gc_set(long minor_heap_size, long space_overhead);
+void gc_compact();
\ No newline at end of file
@@ -1,2 +1,3 @@
-from .voqc import VOQCCircuit, get_library_handle
+__version__ = "0.1.1"
 
+from .voqc import VOQCCircuit, VOQCConnectivityGraph, VOQCLayout, CancellationToken, get_library_handle
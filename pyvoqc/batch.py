@@ -0,0 +1,164 @@
+from collections import namedtuple
+import concurrent.futures
+import itertools
+import os
+import time
+
+from .bindings import PASSES
+from .voqc import VOQCCircuit, VOQCError, get_library_handle
+
+# Result for one input circuit. qasm, stats_before and stats_after are None
+# (and error is set) if the circuit failed to load or optimize. The stats
+# dicts have the same format as VOQCCircuit.gate_stats.
+BatchResult = namedtuple("BatchResult",
+                         ["index", "input", "qasm", "stats_before", "stats_after", "error", "time"])
+
+def is_qasm_string(source):
+    return isinstance(source, str) and "OPENQASM" in source
+
+def load_circuit(lib, source):
+    """Load a circuit from a QASM string or a QASM file name."""
+    if is_qasm_string(source):
+        return VOQCCircuit.from_qasm_string(lib, source)
+    fname = os.fspath(source)
+    if not os.path.isfile(fname):
+        raise VOQCError("QASM file %s does not exist." % fname)
+    return VOQCCircuit(lib, fname)
+
+def error_message(e):
+    # VOQCError.__str__ quotes its message, which is not wanted in reports
+    return e.message if isinstance(e, VOQCError) else str(e) or type(e).__name__
+
+def check_passes(passes):
+    for p in passes:
+        if not (p in PASSES):
+            raise VOQCError("Invalid VOQC pass %s." % p)
+
+def source_label(index, source):
+    return source if not is_qasm_string(source) else "<string %d>" % index
+
+def optimize_one(index, source, passes):
+    """Optimize a single circuit, returning a BatchResult instead of raising."""
+    start = time.perf_counter()
+    label = source_label(index, source)
+    try:
+        c = load_circuit(get_library_handle(), source)
+        before = c.gate_stats()
+        c.run_pipeline(passes)
+        after = c.gate_stats()
+        qasm = c.to_qasm_string()
+        return BatchResult(index, label, qasm, before, after, None, time.perf_counter() - start)
+    except Exception as e:
+        return BatchResult(index, label, None, None, None, error_message(e), time.perf_counter() - start)
+
+class WorkerInitError(VOQCError):
+    """A worker process could not load libvoqc.so."""
+
+_init_error = None
+
+def _init_worker():
+    # load libvoqc.so and start the OCaml runtime once per worker. An exception
+    # raised here would only be logged by the pool, so it is kept and raised
+    # by the first job the worker runs instead.
+    global _init_error
+    try:
+        get_library_handle()
+    except Exception as e:
+        _init_error = error_message(e)
+
+def _run_chunk(jobs):
+    if _init_error is not None:
+        raise WorkerInitError("Failed to start VOQC worker: %s" % _init_error)
+    return [optimize_one(*job) for job in jobs]
+
+def optimize_many(inputs, passes, workers=None, chunksize=1, threads=False):
+    """
+    Optimize many circuits in parallel using a pool of worker processes (or threads).
+
+        Parameters:
+            inputs: iterable of QASM strings or QASM file names
+            passes: sequence of VOQCCircuit pass names (e.g. ["optimize_nam", "replace_rzq"])
+            workers: number of worker processes (default is os.cpu_count())
+            chunksize: number of circuits sent to a worker at a time
+            threads: use a pool of threads in this process instead of worker processes
+
+        Returns:
+            A generator of BatchResults, in completion order. Use the index
+            field to match results with inputs.
+
+        Notes:
+            The OCaml runtime is single-threaded and holds one heap per process,
+            so each worker loads libvoqc.so once and handles many circuits.
+            Failures are reported through BatchResult.error rather than raised,
+            including a worker process crashing (e.g. on a native abort); the
+            pool is then restarted and the circuits that were in flight are
+            retried one at a time to find the one responsible. If the workers
+            cannot load libvoqc.so, VOQCError is raised.
+            With threads=True, nothing is pickled and no processes are started,
+            but calls into VOQC are serialized (see pyvoqc/bindings.py); only
+            file reading and Python-side work overlap.
+    """
+    passes = list(passes)
+    check_passes(passes) # fail before starting any workers
+    jobs = ((i, source, passes) for (i, source) in enumerate(inputs))
+    return _stream(jobs, workers, chunksize, threads)
+
+def _crash_result(job):
+    (index, source, _) = job
+    return BatchResult(index, source_label(index, source), None, None, None,
+                       "VOQC worker process crashed.", 0.0)
+
+def _stream(jobs, workers, chunksize, threads=False, run=_run_chunk):
+    workers = workers or os.cpu_count()
+    pool_class = concurrent.futures.ThreadPoolExecutor if threads else concurrent.futures.ProcessPoolExecutor
+    jobs = iter(jobs)
+    executor = pool_class(workers, initializer=_init_worker)
+    pending = {}
+    try:
+        while True:
+            # keep a bounded number of chunks in flight, so inputs are read lazily
+            while len(pending) < 2 * workers:
+                chunk = list(itertools.islice(jobs, chunksize))
+                if not chunk:
+                    break
+                pending[executor.submit(run, chunk)] = chunk
+            if not pending:
+                break
+            (done, _) = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            suspects = []
+            for f in done:
+                chunk = pending.pop(f)
+                try:
+                    results = f.result()
+                except concurrent.futures.BrokenExecutor:
+                    suspects += chunk
+                    continue
+                for res in results:
+                    yield res
+            if suspects:
+                # a worker died: every job still in the pool is lost with it
+                for (f, chunk) in pending.items():
+                    try:
+                        results = f.result()
+                    except concurrent.futures.BrokenExecutor:
+                        suspects += chunk
+                        continue
+                    for res in results:
+                        yield res
+                pending = {}
+                executor.shutdown(wait=False)
+                for job in suspects:
+                    yield _isolated(pool_class, run, job)
+                executor = pool_class(workers, initializer=_init_worker)
+    finally:
+        for f in pending:
+            f.cancel()
+        executor.shutdown(wait=False)
+
+def _isolated(pool_class, run, job):
+    # run one job in a fresh single-worker pool, so that a crash is attributed to it
+    with pool_class(1, initializer=_init_worker) as executor:
+        try:
+            return executor.submit(run, [job]).result()[0]
+        except concurrent.futures.BrokenExecutor:
+            return _crash_result(job)
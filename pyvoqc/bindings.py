@@ -0,0 +1,149 @@
+from ctypes import *
+import os.path
+import threading
+
+# Low-level bindings for lib/libvoqc.so. The library is loaded and the OCaml
+# runtime is started at most once per process, and every function prototype
+# is declared here once so that callers never touch argtypes/restype.
+#
+# The handle is thread-safe: every call into the library holds LOCK. The OCaml
+# runtime linked into libvoqc.so has a single heap and no domains, so calls
+# from different threads must not overlap, but ctypes releases the GIL during
+# each call, so other threads keep running Python code (parsing, Qiskit
+# conversions) meanwhile. Take LOCK yourself to make a sequence of calls
+# atomic.
+
+class CircIntPair(Structure):
+    _fields_ = [('circ', c_void_p),
+                ('nqbits', c_int)]
+
+class IntIntPair(Structure):
+    _fields_ = [('x', c_int),
+                ('y', c_int)]
+
+# Binary gate representation shared with the C wrapper. op is an index into
+# GATE_NAMES, q0-q2 are qubit arguments and a0-a2 are gate parameters (unused
+# fields are ignored). The parameter of rzq is q in Rz(q * PI).
+class GateRecord(Structure):
+    _fields_ = [('op', c_int),
+                ('q0', c_int),
+                ('q1', c_int),
+                ('q2', c_int),
+                ('a0', c_double),
+                ('a1', c_double),
+                ('a2', c_double)]
+
+GATE_NAMES = ['i', 'x', 'y', 'z', 'h', 's', 't', 'sdg', 'tdg', 'rx', 'ry',
+              'rz', 'rzq', 'u1', 'u2', 'u3', 'cx', 'cz', 'swap', 'ccx', 'ccz']
+
+# (number of qubits, number of parameters) for each gate, in opcode order
+GATE_ARITY = [(1, 0), (1, 0), (1, 0), (1, 0), (1, 0), (1, 0), (1, 0), (1, 0), (1, 0), (1, 1), (1, 1),
+              (1, 1), (1, 1), (1, 1), (1, 2), (1, 3), (2, 0), (2, 0), (2, 0), (3, 0), (3, 0)]
+
+# Gate names used by the count_* functions, in opcode order
+COUNT_NAMES = ["I", "X", "Y", "Z", "H", "S", "T", "Sdg", "Tdg", "Rx", "Ry", "Rz", "Rzq",
+               "U1", "U2", "U3", "CX", "CZ", "SWAP", "CCX", "CCZ"]
+
+# Functions of type value* -> value* (see RUNOPT in lib/ocaml_wrapper.c)
+PASSES = ["convert_to_rzq",
+          "convert_to_ibm",
+          "decompose_to_cnot",
+          "replace_rzq",
+          "optimize_ibm",
+          "not_propagation",
+          "hadamard_reduction",
+          "cancel_single_qubit_gates",
+          "cancel_two_qubit_gates",
+          "merge_rotations",
+          "optimize_nam",
+          "optimize"]
+
+# Optimization passes accepted by VOQCOptimize and the optimization server
+OPTIMIZATIONS = ["optimize_ibm",
+                 "not_propagation",
+                 "hadamard_reduction",
+                 "cancel_single_qubit_gates",
+                 "cancel_two_qubit_gates",
+                 "merge_rotations",
+                 "optimize_nam",
+                 "optimize"]
+
+# (name, argtypes, restype) for every function in lib/ocaml_wrapper.h
+PROTOTYPES = [
+    ("init", None, None),
+    ("destroy", [c_void_p], None),
+    ("copy_root", [c_void_p], c_void_p),
+    ("read_qasm", [c_char_p], CircIntPair),
+    ("write_qasm", [c_void_p, c_int, c_char_p], None),
+    ("read_qasm_string", [c_char_p, c_int], CircIntPair),
+    ("write_qasm_string", [c_void_p, c_int, POINTER(c_int)], POINTER(c_char)),
+    ("free_buffer", [POINTER(c_char)], None),
+    ("circ_from_records", [c_int, c_int, POINTER(GateRecord)], CircIntPair),
+    ("circ_to_records", [c_void_p, c_int, POINTER(GateRecord)], c_int),
+    ("rzq_params", [c_void_p, POINTER(c_int)], POINTER(c_char)),
+    ("set_rzq_params", [c_void_p, c_char_p, c_int], c_void_p),
+    ("count_total", [c_void_p], c_int),
+    ("count_rzq_clifford", [c_void_p], c_int),
+    ("count_all", [c_void_p, POINTER(c_int)], None),
+    ("analyze", [c_void_p, c_int, POINTER(c_int)], c_void_p),
+    ("blit_ints", [c_void_p, POINTER(c_int)], None),
+    ("check_well_typed", [c_void_p, c_int], c_int),
+    ("run_pipeline", [c_void_p, c_int, POINTER(c_char_p), c_int, c_int, POINTER(c_int)], c_void_p),
+    ("circ_append", [c_void_p, c_void_p], c_void_p),
+    ("circ_take", [c_void_p, c_int], c_void_p),
+    ("circ_drop", [c_void_p, c_int], c_void_p),
+    ("decompose_swaps", [c_void_p, c_void_p], c_void_p),
+    ("trivial_layout", [c_int], c_void_p),
+    ("check_list", [c_int, POINTER(c_int)], c_int),
+    ("list_to_layout", [c_int, POINTER(c_int)], c_void_p),
+    ("c_graph_from_coupling_map", [c_int, c_int, POINTER(IntIntPair)], c_void_p),
+    ("check_swap_equivalence", [c_void_p, c_void_p, c_void_p, c_void_p], c_int),
+    ("check_constraints", [c_void_p, c_void_p], c_int),
+    ("greedy_layout", [c_void_p, c_void_p], c_void_p),
+    ("simple_map", [c_void_p, c_void_p, c_void_p, POINTER(c_void_p)], c_void_p),
+    ("layout_to_list", [c_void_p, c_int, POINTER(c_int)], None),
+    ("gc_stats", [POINTER(c_long)], None),
+    ("gc_params", [POINTER(c_long)], None),
+    ("gc_set", [c_long, c_long], None),
+    ("gc_compact", None, None),
+] + [("count_" + g, [c_void_p], c_int) for g in COUNT_NAMES] \
+  + [(p, [c_void_p], c_void_p) for p in PASSES]
+
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib/libvoqc.so')
+
+LOCK = threading.RLock()
+
+class LockedLibrary:
+    '''
+    Library handle whose functions hold LOCK for the duration of each call.
+    Functions are looked up on first use and then cached as attributes.
+    '''
+    def __init__(self, lib):
+        self.cdll = lib
+
+    def __getattr__(self, name):
+        f = getattr(self.cdll, name)
+        def locked(*args):
+            with LOCK:
+                return f(*args)
+        locked.__name__ = name
+        setattr(self, name, locked)
+        return locked
+
+_lib = None
+
+def load_library():
+    """Return the process-wide library handle, loading it on first use."""
+    global _lib
+    with LOCK:
+        if _lib is None:
+            lib = CDLL(LIBRARY_PATH)
+            for (name, argtypes, restype) in PROTOTYPES:
+                f = getattr(lib, name)
+                f.argtypes = argtypes
+                f.restype = restype
+
+            # initialize OCaml code
+            lib.init()
+            _lib = LockedLibrary(lib)
+    return _lib
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+
+from .bindings import LIBRARY_PATH
+from .voqc import VOQCCircuit
+
+_library_version = None
+
+def library_version():
+    """pyvoqc version plus a hash of libvoqc.so, so upgrades invalidate cached results."""
+    global _library_version
+    if _library_version is None:
+        from . import __version__
+        h = hashlib.sha256()
+        with open(LIBRARY_PATH, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _library_version = "%s:%s" % (__version__, h.hexdigest()[:16])
+    return _library_version
+
+# Cached circuits use the VOQCCircuit binary encoding (see to_bytes), which
+# can be loaded without parsing.
+def encode_circuit(c):
+    return c.to_bytes()
+
+def decode_circuit(lib, data):
+    return VOQCCircuit.from_bytes(lib, data)
+
+class OptimizationCache:
+    """
+    Two-tier cache of VOQC results, keyed by a hash of the input circuit, the
+    ordered pass list, the library version and (for mapping) the coupling map.
+
+        Parameters:
+            max_entries: number of results kept in the in-memory LRU tier
+            directory: directory for the on-disk tier (None disables it)
+            max_bytes: size limit of the on-disk tier; least recently used
+                files are evicted when it is exceeded
+
+        Notes:
+            Counters are available through stats(). A hit in the disk tier also
+            populates the memory tier.
+    """
+    def __init__(self, max_entries=1024, directory=None, max_bytes=1 << 30):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_bytes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_bytes = sum(size for (_, size, _) in self._disk_entries())
+
+    def key(self, c, passes, coupling_map=None):
+        h = hashlib.sha256()
+        h.update(library_version().encode("utf-8"))
+        h.update(encode_circuit(c))
+        h.update(repr(list(passes)).encode("utf-8"))
+        if coupling_map is not None:
+            h.update(repr(sorted(tuple(e) for e in coupling_map)).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return the cached bytes for key, or None."""
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path) # mark as recently used
+            except OSError:
+                data = None
+            if data is not None:
+                self.disk_hits += 1
+                self._remember(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.directory:
+            path = self._path(key)
+            if not os.path.exists(path):
+                # write to a temporary file first so readers never see partial results
+                (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                self.disk_bytes += len(data)
+                if self.disk_bytes > self.max_bytes:
+                    self._evict_disk(keep=path)
+
+    def clear(self):
+        self.memory.clear()
+        if self.directory:
+            for (path, _, _) in self._disk_entries():
+                os.remove(path)
+            self.disk_bytes = 0
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return { "hits" : hits,
+                 "memory_hits" : self.memory_hits,
+                 "disk_hits" : self.disk_hits,
+                 "misses" : self.misses,
+                 "hit_rate" : hits / total if total else 0.0,
+                 "evictions" : self.evictions,
+                 "memory_entries" : len(self.memory),
+                 "disk_bytes" : self.disk_bytes }
+
+    def _remember(self, key, data):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".voqc")
+
+    def _disk_entries(self):
+        out = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".voqc"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((path, st.st_size, st.st_mtime_ns))
+        return out
+
+    def _evict_disk(self, keep):
+        # evict least recently used files (other than the one just written)
+        # until we are 10% under the limit
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        self.disk_bytes = sum(size for (_, size, _) in entries)
+        for (path, size, _) in entries:
+            if self.disk_bytes <= 0.9 * self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            self.evictions += 1
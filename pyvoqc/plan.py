@@ -0,0 +1,114 @@
+"""
+Lazy pass plans.
+
+    plan = c.plan().optimize().optimize_nam().convert_to_rzq().replace_rzq()
+    print(plan.explain())
+    plan.result() # or plan.write("out.qasm")
+
+A PassPlan records the passes requested on a VOQCCircuit without running
+them. On result() or write(), redundant steps are removed (see simplify) and
+the remaining passes run in a single run_pipeline call.
+"""
+
+from .bindings import PASSES
+from .voqc import VOQCError
+
+# Passes that may leave Rzq gates in the circuit, and passes after which the
+# circuit has none
+RZQ_SOURCES = { "convert_to_rzq", "not_propagation", "hadamard_reduction", "cancel_single_qubit_gates",
+                "cancel_two_qubit_gates", "merge_rotations", "optimize_nam" }
+RZQ_SINKS = { "replace_rzq", "convert_to_ibm", "optimize_ibm" }
+
+# Passes for which running twice in a row is the same as running once. The
+# optimizations are not listed: a second optimize_nam can occasionally find more.
+IDEMPOTENT = { "convert_to_rzq", "convert_to_ibm", "decompose_to_cnot", "replace_rzq" }
+
+def simplify(passes, input_has_rzq=True):
+    """
+    Remove redundant steps from a pass list. Returns (steps, notes), where
+    notes describe each rewrite. The rules are:
+        optimize is an alias for optimize_nam
+        a repeated idempotent pass is dropped
+        replace_rzq directly before convert_to_rzq is dropped (so repeated
+            convert_to_rzq/replace_rzq pairs collapse to one)
+        replace_rzq is dropped when no Rzq gates can be present
+    """
+    notes = []
+    steps = []
+    for p in passes:
+        if not (p in PASSES):
+            raise VOQCError("Invalid VOQC pass %s." % p)
+        if p == "optimize":
+            notes.append("optimize is the same as optimize_nam")
+            p = "optimize_nam"
+        steps.append(p)
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        rzq = input_has_rzq
+        for p in steps:
+            if out and out[-1] == p and p in IDEMPOTENT:
+                notes.append("dropped repeated %s" % p)
+                changed = True
+                continue
+            if p == "convert_to_rzq" and out and out[-1] == "replace_rzq":
+                notes.append("dropped replace_rzq undone by convert_to_rzq")
+                out.pop()
+                changed = True
+            if p == "replace_rzq" and not rzq:
+                notes.append("dropped replace_rzq (no Rzq gates)")
+                changed = True
+                continue
+            out.append(p)
+            rzq = (rzq or p in RZQ_SOURCES) and not (p in RZQ_SINKS)
+        steps = out
+    return (steps, notes)
+
+class PassPlan:
+    '''
+    Passes recorded for a VOQCCircuit, run on result() or write(). Every
+    VOQCCircuit pass name is available as a chainable method.
+    '''
+    def __init__(self, circuit, passes=()):
+        self.circuit = circuit
+        self.requested = []
+        self.executed = None
+        self.notes = []
+        self.then(*passes)
+
+    def then(self, *passes):
+        for p in passes:
+            if not (p in PASSES):
+                raise VOQCError("Invalid VOQC pass %s." % p)
+        self.requested += passes
+        return self
+
+    def __getattr__(self, name):
+        if name in PASSES:
+            return lambda: self.then(name)
+        raise AttributeError(name)
+
+    def planned(self):
+        """The steps that would run now, and notes on what was removed."""
+        has_rzq = self.circuit.lib.count_Rzq(self.circuit.circ) > 0
+        return simplify(self.requested, has_rzq)
+
+    def result(self):
+        """Run the planned steps (once) and return the circuit."""
+        if self.executed is not None:
+            return self.circuit
+        (steps, self.notes) = self.planned()
+        if steps:
+            self.circuit.run_pipeline(steps)
+        self.executed = steps
+        return self.circuit
+
+    def write(self, fname):
+        self.result().write(fname)
+
+    def explain(self):
+        (steps, notes) = self.planned() if self.executed is None else (self.executed, self.notes)
+        lines = ["requested: %s" % ", ".join(self.requested),
+                 "%s: %s" % ("planned" if self.executed is None else "executed", ", ".join(steps))]
+        return "\n".join(lines + ["  - " + n for n in notes])
@@ -0,0 +1,174 @@
+"""
+Opt-in instrumentation for pyvoqc.
+
+    with Profiler() as prof:
+        vpm.run(circ)
+    print(prof.summary())
+    prof.to_chrome_trace("voqc_trace.json") # open in chrome://tracing or Perfetto
+
+While a Profiler is active, every VOQCCircuit transform and every stage of the
+Qiskit passes (conversion to/from DAGs, each VOQC pass, Qiskit mapping,
+validation) is recorded as a Span with its wall time, gate counts before and
+after, and the change in OCaml heap size. When no Profiler is active the
+instrumentation costs one global lookup per call.
+"""
+
+from contextlib import contextmanager
+from ctypes import c_long
+import json
+import os
+import threading
+import time
+
+from .bindings import load_library
+
+_active = None
+
+class Span:
+    def __init__(self, name, category, start, depth):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.depth = depth
+        self.duration = None
+        self.gates_before = None
+        self.gates_after = None
+        self.heap_words_delta = None
+        self.allocated_words = None
+        self.circuit = None # set by the caller if the stage produces a new circuit
+        self.thread = threading.get_ident()
+
+    def as_dict(self):
+        return { "name" : self.name,
+                 "category" : self.category,
+                 "start" : self.start,
+                 "duration" : self.duration,
+                 "gates_before" : self.gates_before,
+                 "gates_after" : self.gates_after,
+                 "heap_words_delta" : self.heap_words_delta,
+                 "allocated_words" : self.allocated_words }
+
+def _gate_count(obj):
+    # VOQCCircuits and Qiskit DAGs are both supported
+    if obj is None:
+        return None
+    if hasattr(obj, "total_gate_count"):
+        return None if obj.closed else obj.total_gate_count()
+    if hasattr(obj, "size"):
+        return obj.size()
+    return None
+
+class Profiler:
+    """
+    Records Spans while active (use as a context manager or call start/stop).
+
+        Parameters:
+            heap: record OCaml heap deltas (costs two cheap FFI calls per span)
+            per_pass: while profiling, run_pipeline applies passes one call at a
+                time so each pass gets its own span
+    """
+    def __init__(self, heap=True, per_pass=True):
+        self.heap = heap
+        self.per_pass = per_pass
+        self.spans = []
+        self.depth = 0
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.previous = None
+
+    def start(self):
+        global _active
+        self.previous = _active
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        _active = self.previous
+        self.previous = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _heap(self):
+        # see GC_STAT_NAMES in pyvoqc/voqc.py
+        buff = (c_long * 8)()
+        load_library().gc_stats(buff)
+        return (buff[0], buff[5] + buff[7] - buff[6]) # heap words, allocated words
+
+    @contextmanager
+    def span(self, name, circuit=None, category="voqc"):
+        s = Span(name, category, time.perf_counter() - self.origin, self.depth)
+        s.gates_before = _gate_count(circuit)
+        heap = self._heap() if self.heap else None
+        self.depth += 1
+        try:
+            yield s
+        finally:
+            self.depth -= 1
+            s.duration = time.perf_counter() - self.origin - s.start
+            s.gates_after = _gate_count(s.circuit if s.circuit is not None else circuit)
+            if heap is not None:
+                after = self._heap()
+                s.heap_words_delta = after[0] - heap[0]
+                s.allocated_words = after[1] - heap[1]
+            with self.lock:
+                self.spans.append(s)
+
+    def summary(self):
+        """Total, mean and max time per span name, sorted by total time."""
+        out = {}
+        for s in self.spans:
+            e = out.setdefault(s.name, { "count" : 0, "total" : 0.0, "max" : 0.0 })
+            e["count"] += 1
+            e["total"] += s.duration
+            e["max"] = max(e["max"], s.duration)
+        for e in out.values():
+            e["mean"] = e["total"] / e["count"]
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]["total"]))
+
+    def to_json(self, path=None):
+        """Spans as a list of dicts, optionally written to path."""
+        data = [s.as_dict() for s in sorted(self.spans, key=lambda s: s.start)]
+        if path:
+            with open(path, "w") as f:
+                json.dump(data, f, indent=1)
+        return data
+
+    def to_chrome_trace(self, path=None):
+        """Spans in the Chrome trace event format, optionally written to path."""
+        pid = os.getpid()
+        events = []
+        for s in sorted(self.spans, key=lambda s: s.start):
+            args = s.as_dict()
+            for k in ("name", "category", "start", "duration"):
+                del args[k]
+            events.append({ "name" : s.name,
+                            "cat" : s.category,
+                            "ph" : "X",
+                            "ts" : s.start * 1e6,
+                            "dur" : s.duration * 1e6,
+                            "pid" : pid,
+                            "tid" : s.thread,
+                            "args" : args })
+        data = { "traceEvents" : events, "displayTimeUnit" : "ms" }
+        if path:
+            with open(path, "w") as f:
+                json.dump(data, f)
+        return data
+
+def active_profiler():
+    return _active
+
+@contextmanager
+def stage(name, circuit=None, category="voqc"):
+    """Record a span on the active Profiler, if any."""
+    prof = _active
+    if prof is None:
+        yield Span(name, category, 0.0, 0)
+    else:
+        with prof.span(name, circuit, category) as s:
+            yield s
@@ -0,0 +1,224 @@
+"""
+Fast reader for large QASM files.
+
+    c = read_qasm(lib, "adder_1M.qasm", stats)
+    print(stats["mb_per_sec"], stats["gates_per_sec"])
+
+The file is memory-mapped and lexed one statement at a time straight into
+packed gate records, which are passed to VOQCCircuit.from_records. The
+program text is not copied and no syntax tree is built. Memory use is the
+records (40 bytes per gate), a table of each distinct gate and argument text,
+and, while the circuit is built, the OCaml arrays copied from the records
+alongside the OCaml circuit itself. Mapped pages of the file count towards
+the resident size but can be dropped by the OS at any time.
+
+Only the subset of OpenQASM 2.0 that VOQC represents directly is lexed here:
+register declarations, the gates in GATE_NAMES (and id) applied to single
+qubits, and barriers. Parameter expressions using ^ are left to VOQC's reader
+too, since Python's ^ does not have QASM's precedence. Files using anything else (gate definitions, measurements, whole
+register arguments, ...) are read with VOQCCircuit's own reader instead.
+
+Compare the two readers on a file with
+
+    python -m pyvoqc.qasm FILE
+"""
+
+import argparse
+import ast
+import math
+import mmap
+import operator
+import re
+import struct
+import time
+from ctypes import sizeof
+
+from .bindings import GateRecord, GATE_NAMES, GATE_ARITY
+from .voqc import VOQCCircuit, get_library_handle
+
+# One statement (name, parameters, arguments), up to its ';', after any
+# whitespace and comments. A '{' (gate definition) does not match and makes
+# the lexer give up.
+_STATEMENT = re.compile(rb"(?:\s|//[^\n]*)*([A-Za-z_]\w*)\s*(?:\(([^)]*)\))?\s*((?:[^;{/]|/(?!/))*);")
+_TRAILER = re.compile(rb"(?:\s|//[^\n]*)*\Z")
+_ARG = re.compile(rb"\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*\Z")
+
+_RECORD = struct.Struct("@iiiiddd")
+assert _RECORD.size == sizeof(GateRecord)
+
+# rzq is internal to VOQC and has no QASM syntax
+OPCODES = { name.encode() : i for (i, name) in enumerate(GATE_NAMES) if name != "rzq" }
+OPCODES[b"id"] = GATE_NAMES.index("i")
+
+class Unsupported(Exception):
+    """Raised by lex_qasm for programs outside the subset it handles."""
+
+_BINOPS = { ast.Add : operator.add, ast.Sub : operator.sub, ast.Mult : operator.mul,
+            ast.Div : operator.truediv, ast.Pow : operator.pow }
+_FUNCS = { "sin" : math.sin, "cos" : math.cos, "tan" : math.tan, "exp" : math.exp,
+           "ln" : math.log, "sqrt" : math.sqrt }
+
+def _eval(node):
+    if isinstance(node, ast.Expression):
+        return _eval(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return float(node.value)
+    if isinstance(node, ast.Name) and node.id == "pi":
+        return math.pi
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        v = _eval(node.operand)
+        return -v if isinstance(node.op, ast.USub) else v
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        return _BINOPS[type(node.op)](_eval(node.left), _eval(node.right))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in _FUNCS and len(node.args) == 1):
+        return _FUNCS[node.func.id](_eval(node.args[0]))
+    raise Unsupported("unsupported parameter expression")
+
+def parameter(expr, cache):
+    """Value of a QASM parameter expression (bytes), memoized in cache."""
+    v = cache.get(expr)
+    if v is None:
+        try:
+            v = float(expr)
+        except ValueError:
+            # QASM's ^ binds tighter than * and /, Python's looser
+            if b"^" in expr:
+                raise Unsupported("unsupported parameter expression %r" % expr.decode())
+            try:
+                v = _eval(ast.parse(expr.decode().strip(), mode="eval"))
+            except SyntaxError:
+                raise Unsupported("invalid parameter expression %r" % expr.decode())
+        cache[expr] = v
+    return v
+
+def lex_qasm(buf):
+    """
+    Lex a QASM program held in a bytes-like object (e.g. an mmap).
+
+        Returns:
+            (nqbits, records), where records is a bytearray of packed GateRecords.
+            Registers are numbered consecutively in declaration order.
+
+        Raises:
+            Unsupported if the program uses anything outside the subset above
+    """
+    regs = {}
+    nqbits = 0
+    out = bytearray()
+    pack = _RECORD.pack
+    match = _STATEMENT.match
+    # generated circuits repeat the same few gates, parameters and qubit
+    # arguments, so each distinct text is decoded once
+    gates = {}
+    qargs = {}
+    params = {}
+    pos = 0
+    while True:
+        m = match(buf, pos)
+        if m is None:
+            if _TRAILER.match(buf, pos) is None:
+                raise Unsupported("unsupported syntax at byte %d" % pos)
+            break
+        pos = m.end()
+        (name, ps, args) = m.groups()
+        gate = gates.get((name, ps))
+        if gate is None:
+            op = OPCODES.get(name)
+            if op is None:
+                if name == b"qreg":
+                    arg = _ARG.match(args)
+                    if arg is None:
+                        raise Unsupported("invalid qreg declaration")
+                    size = int(arg.group(2))
+                    regs[arg.group(1)] = (nqbits, size)
+                    nqbits += size
+                elif not (name in (b"OPENQASM", b"include", b"creg", b"barrier")):
+                    raise Unsupported("unsupported statement %s" % name.decode())
+                continue
+            (nq, nps) = GATE_ARITY[op]
+            exprs = ps.split(b",") if ps else []
+            if len(exprs) != nps:
+                raise Unsupported("wrong number of parameters for %s" % name.decode())
+            vs = [parameter(e, params) for e in exprs] + [0.0] * (3 - nps)
+            gate = gates[(name, ps)] = (op, nq, vs[0], vs[1], vs[2])
+        qs = qargs.get(args)
+        if qs is None:
+            qs = []
+            for a in args.split(b","):
+                arg = _ARG.match(a)
+                if arg is None or not (arg.group(1) in regs):
+                    raise Unsupported("unsupported argument %r" % a.decode().strip())
+                (offset, size) = regs[arg.group(1)]
+                i = int(arg.group(2))
+                if i >= size:
+                    raise Unsupported("index out of range in %r" % a.decode().strip())
+                qs.append(offset + i)
+            qs = qargs[args] = (len(qs), *(qs + [0, 0])[:3])
+        if qs[0] != gate[1]:
+            raise Unsupported("wrong number of arguments for %s" % name.decode())
+        out += pack(gate[0], qs[1], qs[2], qs[3], gate[2], gate[3], gate[4])
+    return (nqbits, out)
+
+def read_qasm(handle, fname, stats=None):
+    """
+    Read a QASM file into a VOQCCircuit through a memory map.
+
+        Parameters:
+            handle: library handle (see get_library_handle)
+            fname: QASM file name
+            stats: optional dict, filled with bytes, gates, seconds, mb_per_sec,
+                   gates_per_sec and fallback (why VOQCCircuit's reader was
+                   used instead, or None)
+
+        Returns:
+            A VOQCCircuit
+    """
+    start = time.perf_counter()
+    fallback = None
+    with open(fname, "rb") as f:
+        size = f.seek(0, 2)
+        try:
+            if size == 0:
+                raise Unsupported("empty file")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                (nqbits, data) = lex_qasm(buf)
+            records = (GateRecord * (len(data) // _RECORD.size)).from_buffer(data)
+            c = VOQCCircuit.from_records(handle, nqbits, records)
+        except Unsupported as e:
+            fallback = str(e)
+            c = VOQCCircuit(handle, fname)
+    if stats is not None:
+        seconds = time.perf_counter() - start
+        gates = c.total_gate_count()
+        stats.update({ "bytes" : size,
+                       "gates" : gates,
+                       "seconds" : seconds,
+                       "mb_per_sec" : size / 1e6 / seconds if seconds > 0 else None,
+                       "gates_per_sec" : gates / seconds if seconds > 0 else None,
+                       "fallback" : fallback })
+    return c
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the mmap QASM reader with VOQCCircuit's reader.")
+    parser.add_argument("files", nargs="+", help="QASM files")
+    args = parser.parse_args()
+    lib = get_library_handle()
+    for fname in args.files:
+        stats = {}
+        with read_qasm(lib, fname, stats) as c:
+            gates = c.total_gate_count()
+        start = time.perf_counter()
+        with VOQCCircuit(lib, fname):
+            seconds = time.perf_counter() - start
+        print("%s: %d gates, %.1f MB" % (fname, gates, stats["bytes"] / 1e6))
+        if stats["fallback"]:
+            print("  mmap reader: not supported (%s)" % stats["fallback"])
+        else:
+            print("  mmap reader:  %8.3f s  %8.1f MB/s  %10.0f gates/s" %
+                  (stats["seconds"], stats["mb_per_sec"], stats["gates_per_sec"]))
+        print("  read_qasm:    %8.3f s  %8.1f MB/s  %10.0f gates/s" %
+              (seconds, stats["bytes"] / 1e6 / seconds, gates / seconds))
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,20 @@
-from .voqc_pass import VOQCOptimize, VOQCMap, VOQCDecompose3q, voqc_pass_manager
+# Qiskit is only imported when one of the names below is first used, so that
+# `import pyvoqc.qiskit` stays cheap for tools that never touch it.
+_EXPORTS = { "VOQCOptimize" : "voqc_pass",
+             "VOQCMap" : "voqc_pass",
+             "VOQCDecompose3q" : "voqc_pass",
+             "VOQCToDAG" : "voqc_pass",
+             "voqc_pass_manager" : "voqc_pass",
+             "compile_for_backends" : "voqc_pass",
+             "from_dag" : "convert",
+             "to_dag" : "convert" }
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        from importlib import import_module
+        value = getattr(import_module("." + _EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,89 @@
+from qiskit.circuit import QuantumRegister
+from qiskit.circuit.library import (IGate, XGate, YGate, ZGate, HGate, SGate, TGate,
+                                    SdgGate, TdgGate, RXGate, RYGate, RZGate, U1Gate,
+                                    U2Gate, U3Gate, CXGate, CZGate, SwapGate, CCXGate)
+from qiskit.dagcircuit import DAGCircuit
+from math import pi
+
+from pyvoqc import profiling
+from pyvoqc.voqc import VOQCCircuit, VOQCError, GateRecord, GATE_NAMES
+
+OPCODES = { name : i for (i, name) in enumerate(GATE_NAMES) }
+
+def from_dag(lib, dag):
+    """
+    Convert a Qiskit DAG to a VOQC circuit using the binary gate record format.
+
+        Parameters:
+            lib: library handle (see get_library_handle)
+            dag: Qiskit DAGCircuit using only gates in GATE_NAMES
+
+        Returns:
+            A VOQCCircuit acting on dag.num_qubits() qubits
+    """
+    with profiling.stage("from_dag", dag, "qiskit") as span:
+        span.circuit = _from_dag(lib, dag)
+        return span.circuit
+
+def _from_dag(lib, dag):
+    qubits = { q : i for (i, q) in enumerate(dag.qubits) }
+    nodes = list(dag.topological_op_nodes())
+    records = (GateRecord * len(nodes))()
+    for (i, node) in enumerate(nodes):
+        if not (node.name in OPCODES):
+            raise VOQCError("Unsupported gate %s." % node.name)
+        qs = [qubits[q] for q in node.qargs] + [0, 0]
+        try:
+            ps = [float(p) for p in node.op.params] + [0.0, 0.0, 0.0]
+        except TypeError:
+            raise VOQCError("Gate %s has unbound parameters." % node.name)
+        records[i] = GateRecord(OPCODES[node.name], qs[0], qs[1], qs[2], ps[0], ps[1], ps[2])
+    return VOQCCircuit.from_records(lib, dag.num_qubits(), records)
+
+def to_dag(c):
+    """
+    Convert a VOQC circuit to a Qiskit DAG acting on a single register "q".
+    Rzq gates are output as Rz and CCZ gates as H-CCX-H.
+    """
+    with profiling.stage("to_dag", c, "qiskit") as span:
+        span.circuit = _to_dag(c)
+        return span.circuit
+
+def _to_dag(c):
+    dag = DAGCircuit()
+    qr = QuantumRegister(c.nqbits, "q")
+    dag.add_qreg(qr)
+    for r in c.to_records():
+        name = GATE_NAMES[r.op]
+        if name == "ccz":
+            dag.apply_operation_back(HGate(), [qr[r.q2]], [])
+            dag.apply_operation_back(CCXGate(), [qr[r.q0], qr[r.q1], qr[r.q2]], [])
+            dag.apply_operation_back(HGate(), [qr[r.q2]], [])
+        elif name == "rzq":
+            dag.apply_operation_back(RZGate(r.a0 * pi), [qr[r.q0]], [])
+        else:
+            (gate, nq, nps) = _GATES[name]
+            qargs = [qr[q] for q in (r.q0, r.q1, r.q2)[:nq]]
+            dag.apply_operation_back(gate(*(r.a0, r.a1, r.a2)[:nps]), qargs, [])
+    return dag
+
+# (gate class, number of qubits, number of parameters)
+_GATES = { "i" : (IGate, 1, 0),
+           "x" : (XGate, 1, 0),
+           "y" : (YGate, 1, 0),
+           "z" : (ZGate, 1, 0),
+           "h" : (HGate, 1, 0),
+           "s" : (SGate, 1, 0),
+           "t" : (TGate, 1, 0),
+           "sdg" : (SdgGate, 1, 0),
+           "tdg" : (TdgGate, 1, 0),
+           "rx" : (RXGate, 1, 1),
+           "ry" : (RYGate, 1, 1),
+           "rz" : (RZGate, 1, 1),
+           "u1" : (U1Gate, 1, 1),
+           "u2" : (U2Gate, 1, 2),
+           "u3" : (U3Gate, 1, 3),
+           "cx" : (CXGate, 2, 0),
+           "cz" : (CZGate, 2, 0),
+           "swap" : (SwapGate, 2, 0),
+           "ccx" : (CCXGate, 3, 0) }
@@ -1,41 +1,70 @@
-from qiskit import QuantumCircuit
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import time
+
 from qiskit.converters import circuit_to_dag, dag_to_circuit
 from qiskit.transpiler.basepasses import TransformationPass
 from qiskit.transpiler.passmanager import PassManager
-from qiskit.transpiler.passes import CheckMap
-from qiskit.transpiler.passes import VF2Layout
-from qiskit.transpiler.passes import TrivialLayout
-from qiskit.transpiler.passes import DenseLayout
-from qiskit.transpiler.passes import NoiseAdaptiveLayout
-from qiskit.transpiler.passes import SabreLayout
-from qiskit.transpiler.passes import BasicSwap
-from qiskit.transpiler.passes import LookaheadSwap
-from qiskit.transpiler.passes import StochasticSwap
-from qiskit.transpiler.passes import SabreSwap
-from qiskit.transpiler.passes import FullAncillaAllocation
-from qiskit.transpiler.passes import EnlargeWithAncilla
-from qiskit.transpiler.passes import ApplyLayout
-from qiskit.transpiler.passes.layout.vf2_layout import VF2LayoutStopReason
-
-from pyvoqc.voqc import get_library_handle, VOQCCircuit, VOQCError
-import os
+
+from pyvoqc import profiling
+from pyvoqc.batch import error_message, _init_worker
+from pyvoqc.bindings import OPTIMIZATIONS
+from pyvoqc.voqc import get_library_handle, VOQCCircuit, VOQCConnectivityGraph, VOQCLayout, VOQCError
+from pyvoqc.cache import encode_circuit, decode_circuit
+from pyvoqc.validation import TranslationValidator, default_validator
+from pyvoqc.qiskit.convert import from_dag, to_dag
+
+def resident_circuit(property_set, dag):
+    """The VOQCCircuit left in property_set by a resident VOQC pass that returned dag, if any."""
+    c = property_set["voqc_circuit"]
+    if c is not None and property_set["voqc_dag"] is dag:
+        return c
+    return None
+
+def load_circuit(vpass, dag):
+    """The circuit a VOQC pass should work on: the resident one, or dag converted to VOQC."""
+    c = resident_circuit(vpass.property_set, dag)
+    if c is not None:
+        return c
+    # check that gates are supported in VOQC
+    for node in dag.op_nodes():
+        if not (node.name in vpass.voqc_gates):
+            raise VOQCError("Unsupported gate %s." % node.name)
+    return from_dag(get_library_handle(), dag)
+
+def store_circuit(vpass, c, dag):
+    """
+    Return the DAG a VOQC pass should hand to the next pass. A resident pass
+    leaves c in property_set["voqc_circuit"] and returns dag unchanged (so dag
+    is stale until VOQCToDAG runs); otherwise c is converted to a new DAG.
+    """
+    if vpass.resident:
+        vpass.property_set["voqc_circuit"] = c
+        vpass.property_set["voqc_dag"] = dag
+        return dag
+    vpass.property_set["voqc_circuit"] = None
+    return to_dag(c)
 
 class VOQCOptimize(TransformationPass):
     '''
     Qiskit TransformationPass to run VOQC optimizations. 
+    If cache is an OptimizationCache, results are looked up there first.
+    With a time_budget (in seconds) or a CancellationToken, optimization stops
+    between passes (see VOQCCircuit.run_pipeline); the passes that completed
+    are stored in property_set["voqc_completed_passes"].
+    If resident is True, the circuit is kept in VOQC for the next VOQC pass
+    (see store_circuit).
     '''
-    def __init__(self, opts):
+    def __init__(self, opts, cache=None, time_budget=None, cancel=None, resident=False):
         super().__init__()
         self.opts = opts
-        self.defined_opts = [
-            "optimize_ibm",
-            "not_propagation",
-            "hadamard_reduction",
-            "cancel_single_qubit_gates",
-            "cancel_two_qubit_gates",
-            "merge_rotations",
-            "optimize_nam",
-            "optimize" ]
+        self.cache = cache
+        self.time_budget = time_budget
+        self.cancel = cancel
+        self.resident = resident
+        self.defined_opts = list(OPTIMIZATIONS)
         self.voqc_gates = ['i', 'x', 'y', 'z', 'h', 's', 't', 'sdg', 'tdg', 'rx', 'ry', 
                            'rz', 'rzq', 'u1', 'u2', 'u3', 'cx', 'cz', 'swap', 'ccx', 'ccz']
         
@@ -44,202 +73,407 @@ class VOQCOptimize(TransformationPass):
                 raise VOQCError("Invalid VOQC optimization pass %s." % opt)
             
     def run(self, dag):
-        # check that gates are supported in VOQC
-        for node in dag.op_nodes():
-            if not (node.name in self.voqc_gates):
-                raise VOQCError("Unsupported gate %s." % node.name)
-
-        if len(self.opts) > 0:
-            # write qasm file 
-            # TODO : would be nice if we could convert directly from Qiskit's circuit,
-            #        but this requires support in the OCaml code
-            circ = dag_to_circuit(dag)     
-            circ.qasm(formatted=False, filename="temp_in.qasm")
+        if len(self.opts) > 0 or resident_circuit(self.property_set, dag) is not None:
+            c = load_circuit(self, dag)
             
             # apply VOQC transformations
-            self.call_opts("temp_in.qasm", "temp_out.qasm")
+            if len(self.opts) > 0:
+                self.apply_opts(c)
             
-            # convert back to a dag and return
-            opt_circ = QuantumCircuit.from_qasm_file("temp_out.qasm")
-            to_dag = circuit_to_dag(opt_circ)
-            os.remove("temp_in.qasm")
-            os.remove("temp_out.qasm")
-            return to_dag
+            return store_circuit(self, c, dag)
         
         else:
+            # check that gates are supported in VOQC
+            for node in dag.op_nodes():
+                if not (node.name in self.voqc_gates):
+                    raise VOQCError("Unsupported gate %s." % node.name)
             return dag
     
     def call_opts(self, inf, outf):
-        lib = get_library_handle()
-        c = VOQCCircuit(lib, inf)
-        for opt in self.opts:
-            call = getattr(c, opt)
-            call()
-        c.replace_rzq() # always call replace RzQ in case a Nam pass is used
-        c.write(outf)
+        # optimize the QASM file inf into outf
+        with VOQCCircuit(get_library_handle(), inf) as c:
+            self.apply_opts(c)
+            c.write(outf)
+
+    def apply_opts(self, c):
+        # always call replace RzQ in case a Nam pass is used
+        c.apply_passes(list(self.opts) + ["replace_rzq"], cache=self.cache,
+                       time_budget=self.time_budget, cancel=self.cancel)
+        if self.time_budget is not None or self.cancel is not None:
+            self.property_set["voqc_completed_passes"] = c.completed_passes
 
 class VOQCDecompose3q(TransformationPass):
     '''
     Qiskit TransformationPass using VOQC to decompose multi-qubit gates to CNOTs. 
+    If resident is True, the circuit is kept in VOQC for the next VOQC pass.
     '''
-    def __init__(self):
+    def __init__(self, resident=False):
         super().__init__()
+        self.resident = resident
         self.voqc_gates = ['i', 'x', 'y', 'z', 'h', 's', 't', 'sdg', 'tdg', 'rx', 'ry', 
                            'rz', 'rzq', 'u1', 'u2', 'u3', 'cx', 'cz', 'swap', 'ccx', 'ccz']
             
     def run(self, dag):
-        # check that gates are supported in VOQC
-        for node in dag.op_nodes():
-            if not (node.name in self.voqc_gates):
-                raise VOQCError("Unsupported gate %s." % node.name)
-
-        # write qasm file 
-        circ = dag_to_circuit(dag)     
-        circ.qasm(formatted=False, filename="temp_in.qasm")
-        
+        c = load_circuit(self, dag)
+
         # apply VOQC transformations
-        lib = get_library_handle()
-        c = VOQCCircuit(lib, "temp_in.qasm")
         c.decompose_to_cnot()
-        c.write("temp_out.qasm")
 
-        # convert back to a dag and return
-        circ = QuantumCircuit.from_qasm_file("temp_out.qasm")
-        to_dag = circuit_to_dag(circ)
-        os.remove("temp_in.qasm")
-        os.remove("temp_out.qasm")
-        return to_dag
+        return store_circuit(self, c, dag)
+
+class VOQCToDAG(TransformationPass):
+    '''
+    Qiskit TransformationPass that converts the circuit kept by resident VOQC
+    passes back to a DAG. It must run before any non-VOQC pass.
+    '''
+    def run(self, dag):
+        c = resident_circuit(self.property_set, dag)
+        if c is None:
+            return dag
+        self.property_set["voqc_circuit"] = None
+        return to_dag(c)
+
+def qiskit_map(circ, layout_method, routing_method, backend_properties, coupling_map, seed_transpiler):
+    """Apply Qiskit layout and routing to a QuantumCircuit, returning the mapped circuit."""
+    # Qiskit's layout and routing passes are only needed here, so import them lazily
+    from qiskit.transpiler.passes import CheckMap
+    from qiskit.transpiler.passes import VF2Layout
+    from qiskit.transpiler.passes import TrivialLayout
+    from qiskit.transpiler.passes import DenseLayout
+    from qiskit.transpiler.passes import NoiseAdaptiveLayout
+    from qiskit.transpiler.passes import SabreLayout
+    from qiskit.transpiler.passes import BasicSwap
+    from qiskit.transpiler.passes import LookaheadSwap
+    from qiskit.transpiler.passes import StochasticSwap
+    from qiskit.transpiler.passes import SabreSwap
+    from qiskit.transpiler.passes import FullAncillaAllocation
+    from qiskit.transpiler.passes import EnlargeWithAncilla
+    from qiskit.transpiler.passes import ApplyLayout
+    from qiskit.transpiler.passes.layout.vf2_layout import VF2LayoutStopReason
+
+    # apply Qiskit layout/routing, adapted from Qiskit's level 3 pass manager
+    # https://github.com/Qiskit/qiskit-terra/blob/main/qiskit/transpiler/preset_passmanagers/level3.py
+    # TODO: Is it ok to use a PassManager inside of a TransformationPass?
+    def _vf2_match_not_found(property_set):
+        if property_set["layout"] is None:
+            return True
+        if (
+            property_set["VF2Layout_stop_reason"] is not None
+            and property_set["VF2Layout_stop_reason"] is not VF2LayoutStopReason.SOLUTION_FOUND
+        ):
+            return True
+        return False
+    
+    _choose_layout_0 = VF2Layout(
+                            coupling_map,
+                            seed=seed_transpiler,
+                            call_limit=int(3e7),
+                            time_limit=60,
+                            properties=backend_properties,
+                        )
+
+    if layout_method == "trivial":
+        _choose_layout_1 = TrivialLayout(coupling_map)
+    elif layout_method == "dense":
+        _choose_layout_1 = DenseLayout(coupling_map, backend_properties)
+    elif layout_method == "noise_adaptive":
+        _choose_layout_1 = NoiseAdaptiveLayout(backend_properties)
+    elif layout_method == "sabre":
+        _choose_layout_1 = SabreLayout(coupling_map, max_iterations=4, seed=seed_transpiler)
+    else:
+        raise VOQCError("Invalid layout method %s." % layout_method)
+
+    _embed = [FullAncillaAllocation(coupling_map), EnlargeWithAncilla(), ApplyLayout()]
+
+    _swap_check = CheckMap(coupling_map)
+
+    def _swap_condition(property_set):
+        return not property_set["is_swap_mapped"]
+
+    if routing_method == "basic":
+        _swap = [BasicSwap(coupling_map)]
+    elif routing_method == "stochastic":
+        _swap = [StochasticSwap(coupling_map, trials=200, seed=seed_transpiler)]
+    elif routing_method == "lookahead":
+        _swap = [LookaheadSwap(coupling_map, search_depth=5, search_width=6)]
+    elif routing_method == "sabre":
+        _swap = [SabreSwap(coupling_map, heuristic="decay", seed=seed_transpiler)]
+    else:
+        raise VOQCError("Invalid routing method %s." % routing_method)
+
+    pm = PassManager()
+    pm.append(_choose_layout_0)
+    pm.append(_choose_layout_1, condition=_vf2_match_not_found)
+    pm.append(_embed)
+    pm.append(_swap_check)
+    pm.append(_swap, condition=_swap_condition)
+
+    return pm.run(circ)
+
+def layout_list(circ):
+    """The layout of a circuit mapped by qiskit_map, as a list for VOQCCircuit.list_to_layout."""
+    layout = circ._layout
+    regs = layout.get_registers()
+    qs = [r for r in regs if r.name != "ancilla"]
+    anc = [r for r in regs if r.name == "ancilla"]
+    if (len(qs) != 1 or len(anc) > 1):
+        raise VOQCError("Failed to convert mapped circuit's layout to a list.")
+    base = qs[0].size
+    bits = layout.get_physical_bits()
+    out = []
+    for i in range(len(bits)):
+        if bits[i] in qs[0]:
+            out.append(qs[0].index(bits[i]))
+        else:
+            out.append(base + anc[0].index(bits[i]))
+    return out
+
+def validate_mapping(lib, c1, mapped_circ, coupling_map, validator=None):
+    """
+    Check with VOQC that mapped_circ is a correct mapping of the VOQCCircuit c1,
+    and return it as a VOQCCircuit with its SWAPs decomposed, together with the
+    validation report (see TranslationValidator.validate).
+    The trivial layout and connectivity graph are built once per device and
+    shared by all circuits.
+    """
+    c1.use_layout(VOQCLayout.trivial(lib, coupling_map.size()))
+    c2 = from_dag(lib, circuit_to_dag(mapped_circ))
+    c2.list_to_layout(layout_list(mapped_circ))
+    c2.use_c_graph(VOQCConnectivityGraph.cached(lib, coupling_map.size(), coupling_map.get_edges()))
+    with profiling.stage("validate_mapping", c2):
+        report = (validator or default_validator()).validate(c1, c2)
+    return (c2, report)
+
+# Layout methods available with routing_method "voqc"
+VOQC_LAYOUTS = ["greedy", "trivial"]
+
+def check_voqc_layout(layout_method):
+    if not (layout_method is None or layout_method in VOQC_LAYOUTS):
+        raise VOQCError("Layout method %s cannot be used with VOQC routing (use greedy or trivial)." % layout_method)
+
+def voqc_map(lib, c, coupling_map, layout_method):
+    """
+    Map the VOQCCircuit c with VOQC's verified layout ("greedy", the default,
+    or "trivial") and router, and decompose SWAPs.
+    The result is correct by construction, so it is not validated.
+    """
+    check_voqc_layout(layout_method)
+    size = coupling_map.size()
+    c.use_c_graph(VOQCConnectivityGraph.cached(lib, size, coupling_map.get_edges()))
+    if layout_method == "trivial":
+        c.use_layout(VOQCLayout.trivial(lib, size))
+    else:
+        c.greedy_layout()
+    c.simple_map()
+    c.decompose_swaps()
+    return c
+
+# Scores for choosing between mapping trials (lower is better)
+MAP_METRICS = { "cx" : lambda c: c.gate_stats()["counts"].get("CX", 0),
+                "gates" : lambda c: c.total_gate_count(),
+                "depth" : lambda c: c.analyze()["depth"] }
+
+# Validators built in worker processes from the (mode, sample_rate,
+# max_entries) settings of the caller's validator, one per settings, so that
+# the trials run by a worker share cached verdicts
+_trial_validators = {}
+
+def _trial_validator(settings):
+    if settings is None:
+        return default_validator()
+    validator = _trial_validators.get(settings)
+    if validator is None:
+        validator = _trial_validators[settings] = TranslationValidator(*settings)
+    return validator
+
+def _map_trial(job, validator=None):
+    # one layout/routing attempt, run in a worker process (or in this one, with
+    # the caller's validator); returns
+    # (score, encoded circuit, routing method, seed, error, validation report)
+    (circ, layout_method, routing_method, backend_properties, coupling_map, seed, post_opts, metric,
+     validation) = job
+    try:
+        lib = get_library_handle()
+        c1 = from_dag(lib, circuit_to_dag(circ))
+        mapped = qiskit_map(circ, layout_method, routing_method, backend_properties, coupling_map, seed)
+        (c2, report) = validate_mapping(lib, c1, mapped, coupling_map, validator or _trial_validator(validation))
+        if post_opts:
+            c2.run_pipeline(list(post_opts) + ["replace_rzq"])
+        score = (MAP_METRICS[metric](c2), c2.total_gate_count())
+        return (score, encode_circuit(c2), routing_method, seed, None, report)
+    except Exception as e:
+        return (None, None, routing_method, seed, error_message(e), None)
 
 class VOQCMap(TransformationPass):
     '''
     Qiskit TransformationPass to run Qiskit's mapping + VOQC translation validation. 
+    If cache is an OptimizationCache, validated mapping results are looked up there first.
+
+    With routing_method "voqc", VOQC's verified layout (layout_method "greedy",
+    the default, or "trivial") and router are used instead, and no validation
+    is needed.
+
+    With trials > 1, several layout/routing attempts (cycling through
+    routing_methods, with seeds seed_transpiler, seed_transpiler + 1, ...) run in
+    up to workers processes. Each is validated and optimized with post_opts,
+    and the one with the lowest metric ("cx", "gates" or "depth") is kept.
+    Once time_budget seconds have passed, no further trials are waited for
+    (at least one trial always completes) and the worker processes still
+    running trials are terminated. Otherwise the pool is kept for the next
+    run until close() is called. A summary of the trials is stored in
+    property_set["voqc_map_trials"].
+
+    Mappings are checked by validator, a TranslationValidator (default is a
+    process-wide one in cached mode). Trials in worker processes are checked
+    by a validator per process with the same mode, sample_rate and
+    max_entries, so its stats() only count trials run in this process. The
+    report for the last check (or for the best trial) is stored in
+    property_set["voqc_validation"].
+
+    If resident is True, the circuit is kept in VOQC for the next VOQC pass.
     '''
-    def __init__(self, layout_method, routing_method, backend_properties, coupling_map, seed_transpiler):
+    def __init__(self, layout_method, routing_method, backend_properties, coupling_map, seed_transpiler, cache=None,
+                 trials=1, workers=None, metric="cx", time_budget=None, post_opts=None, routing_methods=None,
+                 resident=False, validator=None):
         super().__init__()
+        self.cache = cache
+        self.resident = resident
+        self.validator = validator
         self.layout_method = layout_method
         self.routing_method = routing_method
         self.backend_properties = backend_properties
         self.coupling_map = coupling_map
         self.seed_transpiler = seed_transpiler
+        self.trials = trials
+        self.workers = workers
+        self.metric = metric
+        self.time_budget = time_budget
+        self.post_opts = list(post_opts or [])
+        self.routing_methods = list(routing_methods or [routing_method])
+        self.pool = None
         self.voqc_gates = ['i', 'x', 'y', 'z', 'h', 's', 't', 'sdg', 'tdg', 'rx', 'ry', 
                     'rz', 'rzq', 'u1', 'u2', 'u3', 'cx', 'cz', 'swap', 'ccx', 'ccz']
+        if not (metric in MAP_METRICS):
+            raise VOQCError("Invalid mapping metric %s." % metric)
+        if routing_method == "voqc":
+            check_voqc_layout(layout_method)
             
     def run(self, dag):
-        # check that gates are supported in VOQC
-        for node in dag.op_nodes():
-            if not (node.name in self.voqc_gates):
-                raise VOQCError("Unsupported gate %s." % node.name)
-
-        # save input circuit
-        circ = dag_to_circuit(dag)     
-        circ.qasm(formatted=False, filename="temp_in.qasm")
-        
-        # apply Qiskit layout/routing, adapted from Qiskit's level 3 pass manager
-        # https://github.com/Qiskit/qiskit-terra/blob/main/qiskit/transpiler/preset_passmanagers/level3.py
-        # TODO: Is it ok to use a PassManager inside of a TransformationPass?
-        def _vf2_match_not_found(property_set):
-            if property_set["layout"] is None:
-                return True
-            if (
-                property_set["VF2Layout_stop_reason"] is not None
-                and property_set["VF2Layout_stop_reason"] is not VF2LayoutStopReason.SOLUTION_FOUND
-            ):
-                return True
-            return False
-        
-        _choose_layout_0 = VF2Layout(
-                                self.coupling_map,
-                                seed=self.seed_transpiler,
-                                call_limit=int(3e7),
-                                time_limit=60,
-                                properties=self.backend_properties,
-                            )
-
-        if self.layout_method == "trivial":
-            _choose_layout_1 = TrivialLayout(self.coupling_map)
-        elif self.layout_method == "dense":
-            _choose_layout_1 = DenseLayout(self.coupling_map, self.backend_properties)
-        elif self.layout_method == "noise_adaptive":
-            _choose_layout_1 = NoiseAdaptiveLayout(self.backend_properties)
-        elif self.layout_method == "sabre":
-            _choose_layout_1 = SabreLayout(self.coupling_map, max_iterations=4, seed=self.seed_transpiler)
+        lib = get_library_handle()
+        stale = resident_circuit(self.property_set, dag) is not None
+        c1 = load_circuit(self, dag)
+        if self.cache is not None:
+            key = self.cache_key(c1)
+            data = self.cache.get(key)
+            if data is not None:
+                return store_circuit(self, decode_circuit(lib, data), dag)
+
+        if self.routing_method == "voqc":
+            c2 = self.voqc_map(lib, c1)
+        elif self.trials > 1:
+            c2 = self.run_trials(lib, self.qiskit_circuit(c1, dag, stale))
         else:
-            raise VOQCError("Invalid layout method %s." % self.layout_method)
+            circ = self.qiskit_circuit(c1, dag, stale)
+            with profiling.stage("qiskit_mapping", circ, "qiskit") as span:
+                mapped_circ = qiskit_map(circ, self.layout_method, self.routing_method,
+                                         self.backend_properties, self.coupling_map, self.seed_transpiler)
+                span.circuit = mapped_circ
+            (c2, self.property_set["voqc_validation"]) = validate_mapping(lib, c1, mapped_circ, self.coupling_map,
+                                                                          self.validator)
 
-        _embed = [FullAncillaAllocation(self.coupling_map), EnlargeWithAncilla(), ApplyLayout()]
+        if self.cache is not None:
+            self.cache.put(key, encode_circuit(c2))
 
-        _swap_check = CheckMap(self.coupling_map)
+        return store_circuit(self, c2, dag)
 
-        def _swap_condition(property_set):
-            return not property_set["is_swap_mapped"]
+    def qiskit_circuit(self, c, dag, stale):
+        # Qiskit's layout and routing need a QuantumCircuit; if the circuit is
+        # resident, dag is out of date and c is converted instead
+        return dag_to_circuit(to_dag(c) if stale else dag)
 
-        if self.routing_method == "basic":
-            _swap = [BasicSwap(self.coupling_map)]
-        elif self.routing_method == "stochastic":
-            _swap = [StochasticSwap(self.coupling_map, trials=200, seed=self.seed_transpiler)]
-        elif self.routing_method == "lookahead":
-            _swap = [LookaheadSwap(self.coupling_map, search_depth=5, search_width=6)]
-        elif self.routing_method == "sabre":
-            _swap = [SabreSwap(self.coupling_map, heuristic="decay", seed=self.seed_transpiler)]
+    def voqc_map(self, lib, c):
+        return voqc_map(lib, c, self.coupling_map, self.layout_method)
+
+    def run_trials(self, lib, circ):
+        seed = self.seed_transpiler or 0
+        n = len(self.routing_methods)
+        v = self.validator
+        validation = None if v is None else (v.mode, v.sample_rate, v.max_entries)
+        jobs = [(circ, self.layout_method, self.routing_methods[i % n], self.backend_properties,
+                 self.coupling_map, seed + i // n, self.post_opts, self.metric, validation)
+                for i in range(self.trials)]
+        workers = min(self.workers or os.cpu_count(), self.trials)
+        start = time.perf_counter()
+        results = []
+        if workers == 1:
+            for job in jobs:
+                if self.time_budget is not None and any(r[0] is not None for r in results) \
+                   and time.perf_counter() - start > self.time_budget:
+                    break
+                results.append(_map_trial(job, self.validator))
         else:
-            raise VOQCError("Invalid routing method %s." % self.routing_method)
-
-        pm = PassManager()
-        pm.append(_choose_layout_0)
-        pm.append(_choose_layout_1, condition=_vf2_match_not_found)
-        pm.append(_embed)
-        pm.append(_swap_check)
-        pm.append(_swap, condition=_swap_condition)
-        
-        mapped_circ = pm.run(circ)
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(workers, initializer=_init_worker)
+            done = queue.Queue()
+            for job in jobs:
+                self.pool.apply_async(_map_trial, (job,), callback=done.put,
+                                      error_callback=lambda e, job=job: done.put(
+                                          (None, None, job[2], job[5], error_message(e), None)))
+            try:
+                while len(results) < len(jobs):
+                    timeout = None
+                    if self.time_budget is not None:
+                        timeout = start + self.time_budget - time.perf_counter()
+                        # past the budget, wait only for a first successful trial
+                        if timeout <= 0:
+                            if any(r[0] is not None for r in results):
+                                break
+                            timeout = None
+                    try:
+                        results.append(done.get(timeout=timeout))
+                    except queue.Empty:
+                        pass
+            finally:
+                if len(results) < len(jobs):
+                    # stop the trials still running or queued, so they do not
+                    # use CPU after the budget
+                    self.close()
 
-        # save post-mapping circuit
-        mapped_circ.qasm(formatted=False, filename="temp_out.qasm")
+        self.property_set["voqc_map_trials"] = [ { "routing_method" : r[2], "seed" : r[3], "score" : r[0],
+                                                   "error" : r[4], "validation" : r[5] } for r in results ]
+        ok = [r for r in results if r[0] is not None]
+        if not ok:
+            raise VOQCError("All %d mapping trials failed (first error: %s)." % (len(results), results[0][4]))
+        best = min(ok, key=lambda r: r[0])
+        self.property_set["voqc_validation"] = best[5]
+        return decode_circuit(lib, best[1])
 
-        # apply VOQC mapping validation
-        lib = get_library_handle()
-        c1 = VOQCCircuit(lib, "temp_in.qasm")
-        c1.trivial_layout(self.coupling_map.size())
-        c2 = VOQCCircuit(lib, "temp_out.qasm")
-        c2.list_to_layout(self.get_layout_list(mapped_circ))
-        if c1.check_swap_equivalence(c2) != 1:
-            raise VOQCError("Circuit mapping validation failed (input and output are not equivalent).")
-
-        # apply VOQC SWAP decomposition
-        c2.c_graph_from_coupling_map(self.coupling_map.size(), self.coupling_map.get_edges())
-        c2.decompose_swaps()
-
-        # check that connectivity constraints are satisfied
-        if c2.check_constraints() != 1:
-            raise VOQCError("Circuit mapping validation failed (connectivity constraints not satisfied).")
-        c2.write("temp_out2.qasm")
-
-        # convert back to a dag and return
-        circ = QuantumCircuit.from_qasm_file("temp_out2.qasm")
-        to_dag = circuit_to_dag(circ)
-        os.remove("temp_in.qasm")
-        os.remove("temp_out.qasm")
-        os.remove("temp_out2.qasm")
-        return to_dag
+    def close(self):
+        """Terminate the worker processes used for trials, if any."""
+        if getattr(self, "pool", None) is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        # the pool belongs to this process
+        return dict(self.__dict__, pool=None)
+
+    def cache_key(self, c):
+        # the backend properties only matter through their calibration date
+        props = getattr(self.backend_properties, "last_update_date", None)
+        settings = ["map", self.layout_method, self.routing_method, self.seed_transpiler, str(props)]
+        if self.trials > 1:
+            settings += ["trials", self.trials, self.routing_methods, self.metric, self.post_opts]
+        return self.cache.key(c, settings, self.coupling_map.get_edges())
 
     def get_layout_list(self, circ):
-        layout = circ._layout
-        regs = layout.get_registers()
-        qs = [r for r in regs if r.name != "ancilla"]
-        anc = [r for r in regs if r.name == "ancilla"]
-        if (len(qs) != 1 or len(anc) > 1):
-            raise VOQCError("Failed to convert mapped circuit's layout to a list.")
-        base = qs[0].size
-        bits = layout.get_physical_bits()
-        out = []
-        for i in range(len(bits)):
-            if bits[i] in qs[0]:
-                out.append(qs[0].index(bits[i]))
-            else:
-                out.append(base + anc[0].index(bits[i]))
-        return out
-
-def voqc_pass_manager(pre_opts=None, post_opts=None, layout_method=None, routing_method=None, backend_properties=None, coupling_map=None, seed_transpiler=None) -> PassManager:
+        return layout_list(circ)
+
+def voqc_pass_manager(pre_opts=None, post_opts=None, layout_method=None, routing_method=None, backend_properties=None, coupling_map=None, seed_transpiler=None, cache=None,
+                      trials=1, workers=None, metric="cx", time_budget=None, validator=None) -> PassManager:
     """
     VOQC pass manager. Performs Qiskit layout/routing and VOQC translation validation 
     followed by the specified VOQC optimizations.
@@ -247,11 +481,24 @@ def voqc_pass_manager(pre_opts=None, post_opts=None, layout_method=None, routing
         Parameters:
             pre_opts: sequence of VOQC optimizations to apply before mapping (default is [])
             post_opts: sequence of VOQC optimizations to apply after mapping (default is [optimize])
-            layout_method: Qiskit method to use for layout (default is sabre, VF2Layout is always tried first)
-            routing_method: Qiskit method to use for routing (default is sabre)
+            layout_method: Qiskit method to use for layout (default is sabre, VF2Layout is always tried first),
+                           or greedy (the default) or trivial with voqc routing
+            routing_method: Qiskit method to use for routing (default is sabre), or voqc to
+                            use VOQC's verified layout and routing without validation
             backend_properties: backend properties, used for layout/routing
             coupling_map: CNOT connectivity graph, used for layout/routing
             seed_transpiler: seed for randomness, used for layout/routing
+            cache: OptimizationCache for optimization and mapping results (default is no caching)
+            trials: number of layout/routing attempts (default is 1); with more than one,
+                    seeds and routing methods (sabre, stochastic and lookahead unless
+                    routing_method is given) are varied and the best result is kept
+            workers: number of processes for the trials (default is os.cpu_count())
+            metric: how trials are compared, "cx", "gates" or "depth" (default is cx)
+            time_budget: seconds allowed for each stage (default is no limit): pre_opts and post_opts
+                         stop between passes once it is spent, and unfinished mapping trials are
+                         abandoned
+            validator: TranslationValidator for Qiskit mappings (default is a shared one in cached mode);
+                       trials in worker processes use a copy of its settings (see VOQCMap)
      
         Returns:
             A Qiskit pass manager
@@ -261,20 +508,122 @@ def voqc_pass_manager(pre_opts=None, post_opts=None, layout_method=None, routing
             By default, output will use the gate set {U1, U2, U3, CX}
             If the coupling_map is None, only optimizations will be applied.
             If the optimization list is empty, only mapping will be applied.
+            Between stages the circuit stays in VOQC (see resident_circuit).
+            Without a coupling_map, or with voqc routing, it is converted from
+            a DAG once and back once; Qiskit routing also converts it to a
+            QuantumCircuit and back to map it.
     """
     pre_opts = pre_opts or []
     post_opts = post_opts or ["optimize"]
-    layout_method = layout_method or "sabre"
+    routing_methods = [routing_method] if routing_method else ["sabre", "stochastic", "lookahead"]
     routing_method = routing_method or "sabre"
+    layout_method = layout_method or ("greedy" if routing_method == "voqc" else "sabre")
 
     pm = PassManager()
 
-    pm.append(VOQCOptimize(pre_opts))
+    # all stages work on one circuit kept in VOQC, converted to a DAG only at the end
+    pm.append(VOQCOptimize(pre_opts, cache, time_budget, resident=True))
+
+    if coupling_map and trials > 1 and routing_method != "voqc":
+        # each trial is scored after post-optimization, so the winner is final
+        pm.append(VOQCDecompose3q(resident=True))
+        pm.append(VOQCMap(layout_method, routing_method, backend_properties, coupling_map, seed_transpiler, cache,
+                          trials, workers, metric, time_budget, post_opts, routing_methods, resident=True,
+                          validator=validator))
+        pm.append(VOQCToDAG())
+        return pm
 
     if coupling_map:
-        pm.append(VOQCDecompose3q())
-        pm.append(VOQCMap(layout_method, routing_method, backend_properties, coupling_map, seed_transpiler))
+        pm.append(VOQCDecompose3q(resident=True))
+        pm.append(VOQCMap(layout_method, routing_method, backend_properties, coupling_map, seed_transpiler, cache,
+                          resident=True, validator=validator))
+
+    pm.append(VOQCOptimize(post_opts, cache, time_budget, resident=True))
+    pm.append(VOQCToDAG())
+
+    return pm
+
+def _backend_job(job):
+    # map and post-optimize the shared prefix for one coupling map, in a worker
+    # process; returns (name, encoded circuit, stats, error)
+    (name, data, circ, coupling_map, layout_method, routing_method, backend_properties, seed, post_opts) = job
+    start = time.perf_counter()
+    try:
+        lib = get_library_handle()
+        c1 = VOQCCircuit.from_bytes(lib, data)
+        stats = { "routing_method" : routing_method }
+        if routing_method == "voqc":
+            c2 = voqc_map(lib, c1, coupling_map, layout_method)
+        else:
+            mapped = qiskit_map(circ, layout_method, routing_method, backend_properties, coupling_map, seed)
+            (c2, report) = validate_mapping(lib, c1, mapped, coupling_map)
+            stats["validation"] = report["verdict"]
+        stats["map_time"] = time.perf_counter() - start
+        if post_opts:
+            c2.run_pipeline(list(post_opts) + ["replace_rzq"])
+        gs = c2.gate_stats()
+        stats.update({ "counts" : gs["counts"], "total" : gs["total"], "cx" : gs["counts"].get("CX", 0),
+                       "depth" : c2.analyze()["depth"], "time" : time.perf_counter() - start })
+        return (name, c2.to_bytes(), stats, None)
+    except Exception as e:
+        return (name, None, { "time" : time.perf_counter() - start }, error_message(e))
+
+def compile_for_backends(circ, coupling_maps, pre_opts=None, post_opts=None, layout_method=None, routing_method=None,
+                         backend_properties=None, seed_transpiler=None, workers=None):
+    """
+    Compile one circuit for many devices. The backend-independent prefix
+    (pre_opts and VOQCDecompose3q) runs once; its result is snapshotted with
+    VOQCCircuit.to_bytes and mapped and optimized for each coupling map in
+    parallel, as voqc_pass_manager would.
+
+        Parameters:
+            circ: Qiskit QuantumCircuit
+            coupling_maps: dict from names to CouplingMaps, or a list of CouplingMaps
+                           (named by their index)
+            pre_opts, post_opts, layout_method, routing_method, seed_transpiler: as for voqc_pass_manager
+            backend_properties: dict from names to backend properties, or None
+            workers: number of processes (default is os.cpu_count(); 1 runs in this process)
+
+        Returns:
+            A dict from names to dicts with the compiled QuantumCircuit (None on
+            failure), the error message (or None), and stats: gate counts,
+            total, cx, depth, routing method, validation verdict, and the
+            seconds spent mapping and in total (excluding the shared prefix,
+            which is reported as prefix_time).
+    """
+    pre_opts = pre_opts or []
+    post_opts = post_opts or ["optimize"]
+    routing_method = routing_method or "sabre"
+    layout_method = layout_method or ("greedy" if routing_method == "voqc" else "sabre")
+    if routing_method == "voqc":
+        check_voqc_layout(layout_method)
+    if not isinstance(coupling_maps, dict):
+        coupling_maps = dict(enumerate(coupling_maps))
+    backend_properties = backend_properties or {}
+
+    # backend-independent prefix, once
+    start = time.perf_counter()
+    pm = PassManager([VOQCOptimize(pre_opts, resident=True), VOQCDecompose3q(resident=True)])
+    pm.run(circ)
+    c = pm.property_set["voqc_circuit"]
+    data = c.to_bytes()
+    # Qiskit's routing needs a QuantumCircuit; VOQC's does not
+    prefix = dag_to_circuit(to_dag(c)) if routing_method != "voqc" else None
+    prefix_time = time.perf_counter() - start
 
-    pm.append(VOQCOptimize(post_opts))
+    jobs = [(name, data, prefix, cmap, layout_method, routing_method, backend_properties.get(name),
+             seed_transpiler, post_opts) for (name, cmap) in coupling_maps.items()]
+    workers = min(workers or os.cpu_count(), len(jobs)) or 1
+    if workers == 1:
+        results = [_backend_job(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+            results = list(executor.map(_backend_job, jobs))
 
-    return pm
\ No newline at end of file
+    lib = get_library_handle()
+    out = {}
+    for (name, encoded, stats, error) in results:
+        stats["prefix_time"] = prefix_time
+        compiled = dag_to_circuit(to_dag(VOQCCircuit.from_bytes(lib, encoded))) if encoded else None
+        out[name] = { "circuit" : compiled, "stats" : stats, "error" : error }
+    return out
@@ -0,0 +1,248 @@
+"""
+Long-running VOQC optimization server and asyncio client.
+
+The server keeps libvoqc.so loaded in a pool of worker processes and accepts
+requests over a Unix socket or a localhost TCP port, so clients pay neither
+for starting the OCaml runtime nor for importing Qiskit. Start it with
+
+    python -m pyvoqc.server --socket /tmp/voqc.sock --workers 4
+
+and talk to it with VOQCClient:
+
+    async with VOQCClient(path="/tmp/voqc.sock") as client:
+        res = await client.optimize(qasm, ["optimize_nam"])
+
+Messages are newline-delimited JSON objects. A request has the fields id,
+qasm and passes (names from VOQCOptimize.defined_opts); a response has id,
+ok and either error or the fields of BatchResult.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+
+from .batch import optimize_one, error_message, _init_worker
+from .bindings import OPTIMIZATIONS
+from .voqc import VOQCError
+
+# Large enough for multi-megabyte QASM payloads on a single line
+STREAM_LIMIT = 2 ** 30
+
+class VOQCServer:
+    """
+    Asyncio server that runs VOQC optimizations in a process pool.
+
+        Parameters:
+            path: Unix socket path (if None, listen on host:port instead)
+            host, port: TCP address, used when path is None (port 0 picks a free port)
+            workers: number of worker processes (default is os.cpu_count())
+            max_pending: maximum number of queued or running requests; further
+                requests are rejected with a "server busy" error until some finish
+
+        Notes:
+            As in VOQCOptimize, replace_rzq is always applied after the requested passes.
+            If a worker process dies, the requests in the pool fail and the pool
+            is restarted.
+            Each request runs job(0, qasm, passes) in a worker process;
+            subclasses may replace job with another module-level function
+            returning a BatchResult.
+    """
+    job = staticmethod(optimize_one)
+
+    def __init__(self, path=None, host="127.0.0.1", port=0, workers=None, max_pending=64):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = None
+        self.server = None
+
+    def _new_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker)
+
+    async def start(self):
+        self.executor = self._new_executor()
+        if self.path:
+            self.server = await asyncio.start_unix_server(self._handle, path=self.path, limit=STREAM_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=STREAM_LIMIT)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer, lock):
+        rid = None
+        try:
+            req = json.loads(line)
+            rid = req.get("id")
+            res = await self.submit(req["qasm"], req.get("passes", []))
+            if res.error:
+                msg = { "id" : rid, "ok" : False, "error" : res.error }
+            else:
+                msg = dict(res._asdict(), id=rid, ok=True)
+        except Exception as e:
+            # bad requests, rejected requests and worker pool failures
+            msg = { "id" : rid, "ok" : False, "error" : error_message(e) }
+        async with lock:
+            writer.write(json.dumps(msg).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def submit(self, qasm, passes):
+        """Queue one optimization, raising VOQCError if the queue is full."""
+        for p in passes:
+            if not (p in OPTIMIZATIONS):
+                raise VOQCError("Invalid VOQC optimization pass %s." % p)
+        if self.pending >= self.max_pending:
+            raise VOQCError("Server busy (%d requests pending)." % self.pending)
+        self.pending += 1
+        executor = self.executor
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, self.job, 0, qasm,
+                                              list(passes) + ["replace_rzq"])
+        except concurrent.futures.BrokenExecutor:
+            # a worker died (e.g. on a native abort) and took the pool with it;
+            # requests in flight fail, later ones get a fresh pool
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = self._new_executor()
+            raise VOQCError("VOQC worker process crashed.")
+        finally:
+            self.pending -= 1
+
+class VOQCClient:
+    """
+    Asyncio client for VOQCServer. Several optimize calls may be in flight on
+    one connection at the same time; responses are matched to requests by id.
+    """
+    def __init__(self, path=None, host="127.0.0.1", port=None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.next_id = 0
+        self.waiting = {}
+        self.listener = None
+
+    async def connect(self):
+        if self.path:
+            (self.reader, self.writer) = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+        else:
+            (self.reader, self.writer) = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+        self.listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.listener is not None:
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                fut = self.waiting.pop(msg.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg)
+        finally:
+            for fut in self.waiting.values():
+                if not fut.done():
+                    fut.set_exception(VOQCError("Connection to VOQC server closed."))
+            self.waiting.clear()
+
+    async def optimize(self, qasm, passes):
+        """
+        Optimize a QASM program on the server.
+
+            Returns:
+                A dict with the fields of BatchResult (qasm, stats_before, stats_after, time)
+
+            Raises:
+                VOQCError if the server rejects the request or optimization fails
+        """
+        if self.writer is None:
+            await self.connect()
+        rid = self.next_id
+        self.next_id += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.waiting[rid] = fut
+        req = { "id" : rid, "qasm" : qasm, "passes" : list(passes) }
+        self.writer.write(json.dumps(req).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        msg = await fut
+        if not msg["ok"]:
+            raise VOQCError(msg["error"])
+        return msg
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the VOQC optimization server.")
+    parser.add_argument("--socket", help="Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+
+    async def run():
+        server = await VOQCServer(args.socket, args.host, args.port, args.workers, args.max_pending).start()
+        print("VOQC server listening on %s" % (args.socket or "%s:%d" % (args.host, server.port)), flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
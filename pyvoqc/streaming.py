@@ -0,0 +1,144 @@
+"""
+Memory-bounded optimization of very large QASM programs.
+
+    optimize_stream("big.qasm", "big_opt.qasm", ["optimize_nam", "replace_rzq"])
+
+The input is read one statement at a time and optimized in windows of at most
+window + overlap gates, so the OCaml heap never holds more than one window.
+The last overlap gates of each optimized window are not written out but are
+prepended to the next window, so that cancellations and merges across window
+boundaries are still found. Output is written as soon as each window is done.
+"""
+
+from ctypes import memmove, sizeof, addressof
+import os
+
+from .batch import check_passes
+from .bindings import GateRecord, GATE_NAMES, GATE_ARITY
+from .voqc import VOQCCircuit, VOQCError, get_library_handle
+
+# Statements that declare rather than apply gates; they are repeated at the
+# top of every window so that each window parses with the same qubit numbering
+HEADER_KEYWORDS = ("OPENQASM", "include", "qreg", "creg", "gate", "opaque")
+
+def qasm_statements(f):
+    """Yield the statements of a QASM program (without ';'), reading f line by line."""
+    pending = ""
+    for line in f:
+        pending += line.split("//", 1)[0]
+        pos = 0
+        while True:
+            i = pending.find(";", pos)
+            if i < 0:
+                break
+            j = pending.find("{", pos, i)
+            if j >= 0:
+                # a gate definition ends at its closing brace, not at a ';'
+                k = pending.find("}", j)
+                if k < 0:
+                    break
+                i = k
+            stmt = pending[pos:i + 1].rstrip(";").strip()
+            pos = i + 1
+            if stmt:
+                yield stmt
+        pending = pending[pos:]
+    if pending.strip():
+        raise VOQCError("Unterminated QASM statement: %s" % pending.strip()[:80])
+
+def format_record(r):
+    """QASM text for one gate record."""
+    name = GATE_NAMES[r.op]
+    if name == "rzq":
+        return "rz((%r)*pi) q[%d];\n" % (r.a0, r.q0)
+    if name == "i":
+        # qelib1.inc calls the identity gate id
+        return "id q[%d];\n" % r.q0
+    if name == "ccz":
+        return "h q[%d];\nccx q[%d], q[%d], q[%d];\nh q[%d];\n" % (r.q2, r.q0, r.q1, r.q2, r.q2)
+    (nq, nps) = GATE_ARITY[r.op]
+    params = "(%s)" % ",".join(repr(a) for a in (r.a0, r.a1, r.a2)[:nps]) if nps else ""
+    qargs = ", ".join("q[%d]" % q for q in (r.q0, r.q1, r.q2)[:nq])
+    return "%s%s %s;\n" % (name, params, qargs)
+
+def _concat(a, start, b):
+    # records a[start:] followed by b, as a new GateRecord array
+    na = len(a) - start
+    out = (GateRecord * (na + len(b)))()
+    size = sizeof(GateRecord)
+    if na:
+        memmove(out, addressof(a) + start * size, na * size)
+    if len(b):
+        memmove(addressof(out) + na * size, b, len(b) * size)
+    return out
+
+def _windows(f, window):
+    # yield (header, gate statements) with at most window gate statements each
+    header = []
+    gates = []
+    seen_gates = False
+    for stmt in qasm_statements(f):
+        if stmt.split(None, 1)[0].split("(", 1)[0] in HEADER_KEYWORDS:
+            if seen_gates and stmt.startswith(("qreg", "creg")):
+                raise VOQCError("Register declarations must precede all gates when streaming.")
+            header.append(stmt)
+            continue
+        seen_gates = True
+        gates.append(stmt)
+        if len(gates) == window:
+            yield (header, gates)
+            gates = []
+    yield (header, gates)
+
+def optimize_stream(infile, outfile, passes, window=10000, overlap=1000, handle=None):
+    """
+    Optimize a QASM program window by window, writing the result incrementally.
+
+        Parameters:
+            infile, outfile: file names or open text files
+            passes: VOQCCircuit pass names applied to each window
+            window: number of new gates read into each window
+            overlap: number of optimized gates carried into the next window
+
+        Returns:
+            A dict with the number of qubits, windows, and input and output gates
+
+        Notes:
+            Each window is optimized exactly as a standalone circuit would be,
+            so gates further apart than the overlap are never combined. All
+            registers are flattened into a single output register q.
+    """
+    if overlap >= window:
+        raise VOQCError("overlap (%d) must be smaller than window (%d)." % (overlap, window))
+    check_passes(passes)
+    lib = handle or get_library_handle()
+    fin = open(infile) if isinstance(infile, (str, os.PathLike)) else infile
+    fout = open(outfile, "w") if isinstance(outfile, (str, os.PathLike)) else outfile
+    stats = { "nqbits" : None, "windows" : 0, "gates_in" : 0, "gates_out" : 0 }
+    try:
+        tail = (GateRecord * 0)()
+        start = 0
+        for (header, gates) in _windows(fin, window):
+            src = "".join(s + ("\n" if s.endswith("}") else ";\n") for s in header + gates)
+            with VOQCCircuit.from_qasm_string(lib, src) as c:
+                new = c.to_records()
+                nqbits = c.nqbits
+            if stats["nqbits"] is None:
+                stats["nqbits"] = nqbits
+                fout.write('OPENQASM 2.0;\ninclude "qelib1.inc";\n\nqreg q[%d];\n\n' % nqbits)
+            stats["gates_in"] += len(new)
+            stats["windows"] += 1
+            with VOQCCircuit.from_records(lib, nqbits, _concat(tail, start, new)) as c:
+                c.run_pipeline(passes)
+                tail = c.to_records()
+            # keep the last overlap gates for the next window (all of them are
+            # written after the last window)
+            start = max(0, len(tail) - overlap) if len(gates) == window else len(tail)
+            fout.write("".join(format_record(r) for r in tail[:start]))
+            stats["gates_out"] += start
+        return stats
+    finally:
+        if fin is not infile:
+            fin.close()
+        if fout is not outfile:
+            fout.close()
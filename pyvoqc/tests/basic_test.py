@@ -1,7 +1,9 @@
 # Run all supported functions to check for obvious errors (e.g. seg faults)
 
-from pyvoqc.voqc import VOQCCircuit, get_library_handle
+from pyvoqc.voqc import VOQCCircuit, VOQCConnectivityGraph, VOQCLayout, VOQCError, CancellationToken, NAM_SEQUENCE, get_library_handle, gc_stats, gc_tune, gc_compact
+from concurrent.futures import ThreadPoolExecutor
 import os
+import pickle
 
 rel = os.path.dirname(os.path.abspath(__file__))
 
@@ -10,7 +12,10 @@ lib = get_library_handle()
 c = VOQCCircuit(lib, os.path.join(rel,"../../tutorial-files/tof_3_example.qasm"))
 c.write("out.qasm")
 os.remove("out.qasm")
+c = VOQCCircuit.from_qasm_string(lib, c.to_qasm_string())
+c = VOQCCircuit.from_records(lib, c.nqbits, c.to_records())
 c.count_gates()
+c.gate_stats()
 c.count_rzq_clifford()
 c.total_gate_count()
 c.check_well_typed(5)
@@ -26,14 +31,71 @@ c.cancel_two_qubit_gates()
 c.merge_rotations()
 c.optimize_nam()
 c.optimize()
+c.run_pipeline(["not_propagation", "cancel_single_qubit_gates"], until_fixpoint=True, max_rounds=3)
 c.trivial_layout(5)
 c.list_to_layout([2,0,1,3,4])
 c.c_graph_from_coupling_map(5, [(1, 0), (2, 0), (2, 1), (3, 2), (3, 4), (4, 2)])
 c.decompose_swaps()
 c.check_constraints()
+c.print_info()
+c.greedy_layout()
+c.simple_map()
+c.decompose_swaps()
+assert c.check_constraints()
+assert sorted(c.layout_to_list()) == list(range(5))
 c2 = VOQCCircuit(lib, os.path.join(rel,"../../tutorial-files/tof_3_example.qasm"))
 c2.trivial_layout(5)
 c.check_swap_equivalence(c2)
+c3 = c2.copy()
+c2.close()
+c3.optimize()
+a = c3.analyze()
+assert a["critical_path_length"] == a["depth"] == max(a["qubit_depths"])
+assert sum(a["qubit_gate_counts"]) >= c3.total_gate_count()
+with VOQCCircuit(lib, os.path.join(rel,"../../tutorial-files/tof_3_example.qasm")) as c4:
+    c4.optimize()
+try:
+    c4.optimize()
+    raise AssertionError("closed circuit was usable")
+except VOQCError:
+    pass
+c5 = VOQCCircuit(lib, os.path.join(rel,"../../tutorial-files/tof_3_example.qasm"))
+c5.optimize_incremental()
+n = c5.total_gate_count()
+c5.append(c3)
+c5.append([(4, 0, 0, 0, 0.0, 0.0, 0.0), (4, 0, 0, 0, 0.0, 0.0, 0.0)])
+c5.optimize_incremental(window=10)
+assert c5.optimized_prefix == c5.total_gate_count() <= n + c3.total_gate_count()
+edges = [(1, 0), (2, 0), (2, 1), (3, 2), (3, 4), (4, 2)]
+g = VOQCConnectivityGraph.cached(lib, 5, edges)
+assert VOQCConnectivityGraph.cached(lib, 5, edges[::-1]) is g
+with c3.copy() as c6:
+    c6.use_c_graph(g)
+    c6.use_layout(VOQCLayout.trivial(lib, 5))
+    c6.decompose_swaps()
+    c6.check_constraints()
+assert g.ptr and VOQCLayout.trivial(lib, 5).ptr # shared objects outlive circuits
+c7 = VOQCCircuit(lib, os.path.join(rel,"../../tutorial-files/tof_3_example.qasm"))
+c7.optimize(time_budget=60)
+assert c7.pipeline_complete and c7.completed_passes == NAM_SEQUENCE
+token = CancellationToken()
+token.cancel()
+c7.run_pipeline(["optimize_nam", "replace_rzq"], cancel=token)
+assert not c7.pipeline_complete and c7.completed_passes == []
+c7.run_pipeline(["optimize_nam"], time_budget=0)
+assert not c7.pipeline_complete
+c8 = pickle.loads(pickle.dumps(c))
+assert c8.to_bytes() == c.to_bytes()
+assert c8.layout_to_list() == c.layout_to_list() and c8.check_constraints()
+def optimize_copy(_):
+    c9 = c7.copy()
+    c9.optimize()
+    return c9.total_gate_count()
+with ThreadPoolExecutor(4) as pool: # library calls from several threads are serialized
+    assert len(set(pool.map(optimize_copy, range(8)))) == 1
+gc_tune(minor_heap_size=1 << 20, space_overhead=120)
+gc_compact()
+assert gc_stats()["minor_heap_size"] == 1 << 20
 
 # If you get here, then nothing crashed.
 print("Basic tests passed.")
\ No newline at end of file
@@ -0,0 +1,62 @@
+from pyvoqc.voqc import VOQCError
+from pyvoqc.batch import optimize_many, BatchResult, _stream
+import pyvoqc.bindings
+
+import multiprocessing
+import os
+import unittest
+from unittest import mock
+
+rel = os.path.dirname(os.path.abspath(__file__))
+
+TOF_3 = os.path.join(rel, "../../tutorial-files/tof_3_example.qasm")
+TOF_10 = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+
+def crash_on_negative(jobs):
+    # stands in for a pass that aborts inside native code
+    out = []
+    for (index, source, _) in jobs:
+        if source < 0:
+            os._exit(1)
+        out.append(BatchResult(index, source, None, None, None, None, 0.0))
+    return out
+
+class TestBatch(unittest.TestCase):
+
+    def test_files_and_strings(self):
+        with open(TOF_3) as f:
+            qasm = f.read()
+        results = list(optimize_many([TOF_10, qasm, TOF_3], ["optimize_nam", "replace_rzq"], workers=2))
+        self.assertEqual(sorted(r.index for r in results), [0, 1, 2])
+        for r in results:
+            self.assertIsNone(r.error)
+            self.assertLessEqual(r.stats_after["total"], r.stats_before["total"])
+            self.assertIn("OPENQASM", r.qasm)
+
+    def test_errors_are_reported(self):
+        results = list(optimize_many(["missing.qasm", "OPENQASM 2.0; foo"], ["optimize"], workers=1))
+        self.assertEqual(len(results), 2)
+        for r in results:
+            self.assertIsNone(r.qasm)
+            self.assertIsNotNone(r.error)
+
+    def test_worker_crash(self):
+        jobs = [(i, v, []) for (i, v) in enumerate([1, 2, -1, 3, 4, 5])]
+        results = list(_stream(jobs, 2, 1, run=crash_on_negative))
+        self.assertEqual(sorted(r.index for r in results), list(range(6)))
+        failed = [r.index for r in results if r.error]
+        self.assertEqual(failed, [2])
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == "fork", "workers must inherit the patch")
+    def test_missing_library(self):
+        with mock.patch.object(pyvoqc.bindings, "_lib", None), \
+             mock.patch.object(pyvoqc.bindings, "LIBRARY_PATH", "/nonexistent/libvoqc.so"):
+            with self.assertRaises(VOQCError):
+                list(optimize_many([TOF_3, TOF_10], ["optimize"], workers=1))
+
+    def test_invalid_pass(self):
+        with self.assertRaises(VOQCError):
+            optimize_many([TOF_3], ["foo"])
+
+if __name__ == "__main__":
+    unittest.main()
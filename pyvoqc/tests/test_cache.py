@@ -0,0 +1,59 @@
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+from pyvoqc.cache import OptimizationCache, encode_circuit, decode_circuit
+
+import math
+import os
+import pickle
+import tempfile
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+
+class TestCache(unittest.TestCase):
+
+    def test_memory_lru(self):
+        cache = OptimizationCache(max_entries=2)
+        cache.put("a", b"1")
+        cache.put("b", b"2")
+        cache.get("a")
+        cache.put("c", b"3") # evicts b, the least recently used entry
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1")
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_disk_eviction(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = OptimizationCache(max_entries=1, directory=d, max_bytes=250)
+            for k in "abc":
+                cache.put(k, bytes(100))
+            self.assertLessEqual(cache.disk_bytes, 250)
+            self.assertGreater(cache.stats()["evictions"], 0)
+            self.assertEqual(cache.get("c"), bytes(100))
+
+            # a fresh cache sees the files left on disk
+            cache2 = OptimizationCache(directory=d)
+            self.assertEqual(cache2.get("c"), bytes(100))
+            self.assertEqual(cache2.stats()["disk_hits"], 1)
+
+    def test_apply_passes_hit(self):
+        lib = get_library_handle()
+        fname = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+        cache = OptimizationCache()
+        c1 = VOQCCircuit(lib, fname).apply_passes(["optimize_nam"], cache=cache)
+        c2 = VOQCCircuit(lib, fname).apply_passes(["optimize_nam"], cache=cache)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(c1.gate_stats(), c2.gate_stats())
+
+    def test_rzq_round_trip(self):
+        # rotations whose merged Rzq parameters are not exact doubles
+        lib = get_library_handle()
+        gates = [(11, 0, 0, 0, a, 0.0, 0.0) for a in (0.1, 1 / 3, math.pi / 7, 2.5)]
+        c = VOQCCircuit.from_records(lib, 1, gates).convert_to_rzq().merge_rotations()
+        params = c.rzq_params()
+        self.assertTrue(params)
+        for c2 in (pickle.loads(pickle.dumps(c)), decode_circuit(lib, encode_circuit(c))):
+            self.assertEqual(c2.rzq_params(), params)
+            self.assertEqual(c2.to_bytes(), c.to_bytes())
+
+if __name__ == "__main__":
+    unittest.main()
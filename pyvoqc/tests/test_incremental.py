@@ -0,0 +1,41 @@
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+fname = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+
+# five gates (H, X, H, CX, H) as gate records
+GATES = [(4, 0, 0, 0, 0.0, 0.0, 0.0), (1, 1, 0, 0, 0.0, 0.0, 0.0), (4, 0, 0, 0, 0.0, 0.0, 0.0),
+         (16, 0, 1, 0, 0.0, 0.0, 0.0), (4, 2, 0, 0, 0.0, 0.0, 0.0)]
+
+class TestIncremental(unittest.TestCase):
+
+    def test_append_keeps_prefix(self):
+        c = VOQCCircuit(get_library_handle(), fname).optimize_incremental()
+        n = c.total_gate_count()
+        self.assertEqual(c.optimized_prefix, n)
+        c.append(GATES)
+        self.assertEqual(c.optimized_prefix, n)
+        self.assertEqual(c.total_gate_count(), n + 5)
+
+    def test_transforms_reset_prefix(self):
+        c = VOQCCircuit(get_library_handle(), fname).optimize_incremental()
+        c.append(GATES)
+        c.optimize()
+        self.assertEqual(c.optimized_prefix, 0)
+        c.append(GATES)
+        expected = c.copy().optimize()
+        # the whole circuit is optimized again, including the new gates
+        c.optimize_incremental()
+        self.assertEqual(c.to_qasm_string(), expected.to_qasm_string())
+
+        for transform in (lambda c: c.decompose_to_cnot(), lambda c: c.run_pipeline(["not_propagation"]),
+                          lambda c: c.convert_to_rzq()):
+            c.optimize_incremental()
+            transform(c)
+            self.assertEqual(c.optimized_prefix, 0)
+
+if __name__ == "__main__":
+    unittest.main()
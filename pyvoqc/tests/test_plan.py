@@ -0,0 +1,42 @@
+from pyvoqc.voqc import VOQCCircuit, VOQCError, get_library_handle
+from pyvoqc.plan import simplify
+
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+
+class TestPlan(unittest.TestCase):
+
+    def test_alias_and_repeats(self):
+        (steps, notes) = simplify(["optimize", "optimize_nam", "replace_rzq", "replace_rzq"])
+        # a second round of optimization may find more, so it is kept
+        self.assertEqual(steps, ["optimize_nam", "optimize_nam", "replace_rzq"])
+        self.assertEqual(len(notes), 2)
+
+    def test_rzq_pairs(self):
+        passes = ["convert_to_rzq", "replace_rzq"] * 3
+        self.assertEqual(simplify(passes)[0], ["convert_to_rzq", "replace_rzq"])
+
+    def test_replace_rzq_without_sources(self):
+        self.assertEqual(simplify(["optimize_ibm", "replace_rzq"])[0], ["optimize_ibm"])
+        self.assertEqual(simplify(["replace_rzq"], input_has_rzq=False)[0], [])
+        self.assertEqual(simplify(["replace_rzq"], input_has_rzq=True)[0], ["replace_rzq"])
+
+    def test_invalid_pass(self):
+        with self.assertRaises(VOQCError):
+            simplify(["optimise"])
+
+    def test_lazy_result(self):
+        lib = get_library_handle()
+        c = VOQCCircuit(lib, os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        n = c.total_gate_count()
+        plan = c.plan().optimize().replace_rzq().convert_to_rzq().replace_rzq()
+        self.assertEqual(c.total_gate_count(), n) # nothing has run yet
+        self.assertIn("planned: optimize_nam, convert_to_rzq, replace_rzq", plan.explain())
+        plan.result()
+        self.assertEqual(plan.executed, ["optimize_nam", "convert_to_rzq", "replace_rzq"])
+        self.assertLess(c.total_gate_count(), n)
+
+if __name__ == "__main__":
+    unittest.main()
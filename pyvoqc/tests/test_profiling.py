@@ -0,0 +1,42 @@
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+from pyvoqc.profiling import Profiler, stage, active_profiler
+
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+
+class TestProfiling(unittest.TestCase):
+
+    def test_spans_and_export(self):
+        with Profiler(heap=False) as prof:
+            with stage("outer"):
+                with stage("inner"):
+                    pass
+        self.assertIsNone(active_profiler())
+        self.assertEqual([s.name for s in prof.spans], ["inner", "outer"])
+        self.assertEqual(prof.spans[0].depth, 1)
+        self.assertEqual(prof.summary()["outer"]["count"], 1)
+        events = prof.to_chrome_trace()["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["outer", "inner"])
+        self.assertEqual(events[0]["ph"], "X")
+
+    def test_inactive(self):
+        with stage("ignored") as span:
+            span.circuit = None
+        self.assertIsNone(active_profiler())
+
+    def test_per_pass_spans(self):
+        lib = get_library_handle()
+        fname = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+        c = VOQCCircuit(lib, fname)
+        with Profiler() as prof:
+            c.run_pipeline(["optimize_nam", "replace_rzq"])
+        names = [s.name for s in prof.spans]
+        self.assertEqual(names, ["optimize_nam", "replace_rzq", "run_pipeline"])
+        nam = prof.spans[0]
+        self.assertGreater(nam.gates_before, nam.gates_after)
+        self.assertEqual(prof.spans[-1].gates_after, c.total_gate_count())
+
+if __name__ == "__main__":
+    unittest.main()
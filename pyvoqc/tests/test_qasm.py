@@ -0,0 +1,46 @@
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+from pyvoqc.bindings import GateRecord
+from pyvoqc.qasm import lex_qasm, read_qasm, Unsupported
+
+from math import pi
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+fname = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+
+def records(data):
+    return [(r.op, r.q0, r.q1, r.q2, r.a0, r.a1, r.a2)
+            for r in (GateRecord * (len(data) // 40)).from_buffer(data)]
+
+class TestQasm(unittest.TestCase):
+
+    def test_lex(self):
+        (nqbits, data) = lex_qasm(b'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg a[2]; qreg b[1]; // comment\n'
+                                  b'rz(-pi/4) b[0];\nu3(0.5, pi*pi, 2*pi) a[1];\ncx a[0],\n b[0];\nid a[0];\n')
+        self.assertEqual(nqbits, 3)
+        self.assertEqual(records(data), [(11, 2, 0, 0, -pi / 4, 0.0, 0.0),
+                                         (15, 1, 0, 0, 0.5, pi ** 2, 2 * pi),
+                                         (16, 0, 2, 0, 0.0, 0.0, 0.0),
+                                         (0, 0, 0, 0, 0.0, 0.0, 0.0)])
+
+    def test_unsupported(self):
+        for src in [b"qreg q[1]; gate g a { h a; }", b"qreg q[2]; h q;", b"qreg q[2]; cx q[0];",
+                    b"qreg q[1]; creg c[1]; measure q[0] -> c[0];", b"qreg q[1]; rz(foo) q[0];",
+                    # a[2] is not b[0]
+                    b"qreg a[2]; qreg b[1]; h a[2];",
+                    # QASM reads 2*pi^2 as 2*(pi^2), Python as (2*pi)^2
+                    b"qreg q[1]; rz(2*pi^2) q[0];"]:
+            with self.assertRaises(Unsupported):
+                lex_qasm(src)
+
+    def test_matches_read_qasm(self):
+        lib = get_library_handle()
+        stats = {}
+        c = read_qasm(lib, fname, stats)
+        self.assertIsNone(stats["fallback"])
+        self.assertEqual(stats["gates"], 17)
+        self.assertEqual(c.to_qasm_string(), VOQCCircuit(lib, fname).to_qasm_string())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,8 +4,11 @@ from qiskit.test.mock import FakeAlmaden
 from qiskit.transpiler import CouplingMap
 from qiskit.transpiler import PassManager
 
-from pyvoqc.voqc import VOQCError
-from pyvoqc.qiskit import voqc_pass_manager
+from qiskit.converters import circuit_to_dag, dag_to_circuit
+
+from pyvoqc.voqc import VOQCError, get_library_handle
+from pyvoqc.validation import TranslationValidator
+from pyvoqc.qiskit import voqc_pass_manager, compile_for_backends, from_dag, to_dag, VOQCOptimize, VOQCDecompose3q, VOQCToDAG, VOQCMap
 
 import os
 import unittest
@@ -65,6 +68,17 @@ class TestQiskitPass(unittest.TestCase):
         after.sdg(0)
         self.assertEqual(self.run_optimization(before, ["hadamard_reduction"]), after)
 
+    def test_dag_round_trip(self):
+        circ = QuantumCircuit(3)
+        circ.h(0)
+        circ.u3(0.1, 0.2, 0.3, 1)
+        circ.ccx(0, 1, 2)
+        circ.swap(1, 2)
+        circ.rz(pi/8, 2)
+        c = from_dag(get_library_handle(), circuit_to_dag(circ))
+        self.assertEqual(c.total_gate_count(), 5)
+        self.assertEqual(dag_to_circuit(to_dag(c)), circ)
+
     def test_invalid_function(self):
         before = QuantumCircuit(1)
         before.x(0)
@@ -93,6 +107,70 @@ class TestQiskitPass(unittest.TestCase):
         c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
         self.run_mapping(c, "sabre", "sabre")
 
+    def test_trivial_voqc_mapping(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        self.run_mapping(c, "trivial", "voqc")
+
+    def test_greedy_voqc_mapping(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        self.run_mapping(c, "greedy", "voqc")
+
+    def test_invalid_voqc_layout(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        with self.assertRaises(VOQCError):
+            self.run_mapping(c, "sabre", "voqc")
+
+    def test_parallel_trials(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        backend = FakeAlmaden()
+        c_map = CouplingMap(couplinglist=backend.configuration().coupling_map)
+        vpm = voqc_pass_manager(coupling_map=c_map, seed_transpiler=1, trials=4, workers=2, metric="cx")
+        vpm.run(c)
+        trials = vpm.property_set["voqc_map_trials"]
+        self.assertEqual(len(trials), 4)
+        self.assertEqual({t["routing_method"] for t in trials}, {"sabre", "stochastic", "lookahead"})
+
+    def test_trial_pool_reused(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        c_map = CouplingMap(couplinglist=FakeAlmaden().configuration().coupling_map)
+        vmap = VOQCMap("sabre", "sabre", None, c_map, 1, trials=2, workers=2)
+        pm = PassManager([VOQCDecompose3q(), vmap])
+        pm.run(c)
+        pool = vmap.pool
+        self.assertIsNotNone(pool)
+        pm.run(c)
+        self.assertIs(vmap.pool, pool)
+        vmap.close()
+        self.assertIsNone(vmap.pool)
+
+    def test_trials_use_validator(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        backend = FakeAlmaden()
+        c_map = CouplingMap(couplinglist=backend.configuration().coupling_map)
+        validator = TranslationValidator(mode="always")
+        vpm = voqc_pass_manager(coupling_map=c_map, seed_transpiler=1, trials=2, workers=1, validator=validator)
+        vpm.run(c)
+        self.assertEqual(validator.stats()["full_checks"], 2)
+        self.assertEqual(vpm.property_set["voqc_validation"]["verdict"], "full")
+
+    def test_resident_pipeline(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        converting = PassManager([VOQCOptimize(["optimize_nam"]), VOQCDecompose3q(), VOQCOptimize(["optimize_nam"])])
+        resident = PassManager([VOQCOptimize(["optimize_nam"], resident=True), VOQCDecompose3q(resident=True),
+                                VOQCOptimize(["optimize_nam"], resident=True), VOQCToDAG()])
+        self.assertEqual(resident.run(c), converting.run(c))
+        self.assertIsNone(resident.property_set["voqc_circuit"])
+
+    def test_compile_for_backends(self):
+        c = QuantumCircuit.from_qasm_file(os.path.join(rel, "test_qasm_files/tof_10.qasm"))
+        c_maps = { "line" : CouplingMap.from_line(20), "ring" : CouplingMap.from_ring(20) }
+        results = compile_for_backends(c, c_maps, routing_method="voqc", workers=2)
+        self.assertEqual(set(results), {"line", "ring"})
+        for (name, res) in results.items():
+            self.assertIsNone(res["error"])
+            expected = voqc_pass_manager(coupling_map=c_maps[name], routing_method="voqc").run(c)
+            self.assertEqual(res["stats"]["total"], expected.size())
+
     def run_optimization(self, circ, opts=None):
         vpm = voqc_pass_manager(post_opts=opts)
         new_circ = vpm.run(circ)
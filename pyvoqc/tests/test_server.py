@@ -0,0 +1,66 @@
+from pyvoqc.voqc import VOQCError
+from pyvoqc.server import VOQCServer, VOQCClient
+from pyvoqc.batch import BatchResult
+
+import asyncio
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+
+def crash_or_echo(index, qasm, passes):
+    # stands in for a pass that aborts inside native code
+    if qasm == "crash":
+        os._exit(1)
+    return BatchResult(index, "<string>", qasm, None, None, None, 0.0)
+
+class CrashingServer(VOQCServer):
+    job = staticmethod(crash_or_echo)
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = await VOQCServer(port=0, workers=2, max_pending=4).start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_optimize(self):
+        with open(os.path.join(rel, "test_qasm_files/tof_10.qasm")) as f:
+            qasm = f.read()
+        async with VOQCClient(port=self.server.port) as client:
+            results = await asyncio.gather(*[client.optimize(qasm, ["optimize_nam"]) for _ in range(3)])
+        for res in results:
+            self.assertLess(res["stats_after"]["total"], res["stats_before"]["total"])
+            self.assertIn("OPENQASM", res["qasm"])
+
+    async def test_invalid_pass(self):
+        async with VOQCClient(port=self.server.port) as client:
+            with self.assertRaises(VOQCError):
+                await client.optimize("OPENQASM 2.0;", ["foo"])
+
+    async def test_backpressure(self):
+        with open(os.path.join(rel, "test_qasm_files/tof_10.qasm")) as f:
+            qasm = f.read()
+        async with VOQCClient(port=self.server.port) as client:
+            results = await asyncio.gather(*[client.optimize(qasm, ["optimize"]) for _ in range(8)],
+                                           return_exceptions=True)
+        busy = [r for r in results if isinstance(r, VOQCError)]
+        self.assertTrue(all("busy" in e.message for e in busy))
+        self.assertGreaterEqual(len(results) - len(busy), 4)
+
+    async def test_worker_crash(self):
+        server = await CrashingServer(port=0, workers=2).start()
+        try:
+            async with VOQCClient(port=server.port) as client:
+                with self.assertRaises(VOQCError) as cm:
+                    await client.optimize("crash", [])
+                self.assertIn("crashed", cm.exception.message)
+                # the pool is rebuilt for later requests
+                res = await client.optimize("OPENQASM 2.0;", [])
+            self.assertEqual(res["qasm"], "OPENQASM 2.0;")
+        finally:
+            await server.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+from pyvoqc.voqc import VOQCCircuit, get_library_handle
+from pyvoqc.bindings import GateRecord
+from pyvoqc.streaming import optimize_stream, qasm_statements, format_record
+
+import io
+import os
+import unittest
+
+rel = os.path.dirname(os.path.abspath(__file__))
+fname = os.path.join(rel, "test_qasm_files/tof_10.qasm")
+
+class TestStreaming(unittest.TestCase):
+
+    def test_statements(self):
+        src = io.StringIO('OPENQASM 2.0; // version\ngate g a { h a; x a; }\nh q[0]; cx q[0],\n q[1];\n')
+        self.assertEqual(list(qasm_statements(src)),
+                         ["OPENQASM 2.0", "gate g a { h a; x a; }", "h q[0]", "cx q[0],\n q[1]"])
+
+    def test_format_record(self):
+        self.assertEqual(format_record(GateRecord(0, 3, 0, 0, 0.0, 0.0, 0.0)), "id q[3];\n")
+        self.assertEqual(format_record(GateRecord(16, 0, 2, 0, 0.0, 0.0, 0.0)), "cx q[0], q[2];\n")
+        self.assertEqual(format_record(GateRecord(12, 1, 0, 0, 0.25, 0.0, 0.0)), "rz((0.25)*pi) q[1];\n")
+
+    def test_windows_match_full(self):
+        lib = get_library_handle()
+        out = io.StringIO()
+        stats = optimize_stream(fname, out, ["optimize_nam", "replace_rzq"], window=8, overlap=3)
+        self.assertGreater(stats["windows"], 1)
+        c = VOQCCircuit.from_qasm_string(lib, out.getvalue())
+        self.assertEqual(c.nqbits, 19)
+        self.assertEqual(c.total_gate_count(), stats["gates_out"])
+        self.assertLess(stats["gates_out"], stats["gates_in"])
+
+        # a single window is the same as optimizing the whole circuit
+        out = io.StringIO()
+        stats = optimize_stream(fname, out, ["optimize_nam"], window=1000, overlap=10)
+        full = VOQCCircuit(lib, fname).optimize_nam()
+        self.assertEqual(stats["gates_out"], full.total_gate_count())
+
+if __name__ == "__main__":
+    unittest.main()
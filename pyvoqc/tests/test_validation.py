@@ -0,0 +1,59 @@
+from pyvoqc.voqc import VOQCCircuit, VOQCConnectivityGraph, VOQCLayout, VOQCError, get_library_handle
+from pyvoqc.validation import TranslationValidator
+
+import unittest
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[3];\n'
+LINE = [(0, 1), (1, 0), (1, 2), (2, 1)]
+
+class TestValidation(unittest.TestCase):
+
+    def pair(self, mapped="swap q[0], q[1];\ncx q[1], q[2];\n"):
+        lib = get_library_handle()
+        c1 = VOQCCircuit.from_qasm_string(lib, HEADER + "cx q[0], q[2];\n")
+        c1.use_layout(VOQCLayout.trivial(lib, 3))
+        c2 = VOQCCircuit.from_qasm_string(lib, HEADER + mapped)
+        c2.list_to_layout([0, 1, 2])
+        c2.use_c_graph(VOQCConnectivityGraph.cached(lib, 3, LINE))
+        return (c1, c2)
+
+    def test_cached(self):
+        validator = TranslationValidator(mode="cached")
+        self.assertEqual(validator.validate(*self.pair())["verdict"], "full")
+        (c1, c2) = self.pair()
+        self.assertEqual(validator.validate(c1, c2)["verdict"], "cached")
+        self.assertEqual(c2.count_gates()["CX"], 4) # SWAPs are decomposed either way
+        stats = validator.stats()
+        self.assertEqual((stats["full_checks"], stats["cache_hits"]), (1, 1))
+
+    def test_always(self):
+        validator = TranslationValidator(mode="always")
+        validator.validate(*self.pair())
+        self.assertEqual(validator.validate(*self.pair())["verdict"], "full")
+
+    def test_sampled(self):
+        validator = TranslationValidator(mode="sampled", sample_rate=0.0)
+        self.assertEqual(validator.validate(*self.pair())["verdict"], "sampled_out")
+        self.assertEqual(validator.stats()["full_checks"], 0)
+        # connectivity is checked even when equivalence is sampled out
+        with self.assertRaises(VOQCError):
+            validator.validate(*self.pair("cx q[0], q[2];\n"))
+        self.assertEqual(validator.stats()["failures"], 1)
+
+    def test_failures(self):
+        validator = TranslationValidator(mode="sampled", sample_rate=0.0)
+        # an extra gate is caught by the structural checks
+        with self.assertRaises(VOQCError):
+            validator.validate(*self.pair("swap q[0], q[1];\ncx q[1], q[2];\nh q[0];\n"))
+        # a wrong target needs the full check
+        validator = TranslationValidator(mode="cached")
+        with self.assertRaises(VOQCError):
+            validator.validate(*self.pair("swap q[0], q[1];\ncx q[1], q[0];\n"))
+        self.assertEqual(validator.stats()["failures"], 1)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(VOQCError):
+            TranslationValidator(mode="never")
+
+if __name__ == "__main__":
+    unittest.main()
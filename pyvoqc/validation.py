@@ -0,0 +1,151 @@
+"""
+Translation validation for mapped circuits.
+
+VOQCMap checks every circuit mapped by Qiskit with VOQC's verified
+check_swap_equivalence and check_constraints. A TranslationValidator puts
+cheap structural checks in front of those and remembers which (input, mapped)
+pairs already passed, so that retries and replays are not validated again.
+
+    validator = TranslationValidator(mode="sampled", sample_rate=0.05)
+    pm = voqc_pass_manager(coupling_map=cmap, validator=validator)
+    ...
+    print(validator.stats())
+
+Modes:
+    always: every pair is fully validated, and nothing is cached
+    cached: pairs that passed before are accepted; others are fully validated
+    sampled: like cached, but the swap equivalence of a pair not seen before
+             is checked only with probability sample_rate
+
+Connectivity constraints are cheap to check and are always checked, whatever
+the mode.
+"""
+
+from collections import OrderedDict
+import hashlib
+import random
+import threading
+import time
+
+from .voqc import VOQCError
+
+MODES = ("always", "cached", "sampled")
+
+class TranslationValidator:
+    '''
+    Validates that a mapped VOQCCircuit is equivalent to its input and
+    satisfies its connectivity constraints, caching positive verdicts.
+
+        Parameters:
+            mode: "always", "cached" or "sampled" (see above)
+            sample_rate: fraction of new pairs fully validated in sampled mode
+            max_entries: number of positive verdicts remembered (LRU)
+            seed: seed for choosing which pairs are sampled
+    '''
+    def __init__(self, mode="cached", sample_rate=0.1, max_entries=4096, seed=None):
+        if not (mode in MODES):
+            raise VOQCError("Invalid validation mode %s." % mode)
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_entries = max_entries
+        self.verdicts = OrderedDict()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = { "validations" : 0, "cache_hits" : 0, "full_checks" : 0,
+                        "sampled_out" : 0, "failures" : 0 }
+        self.times = { "structural" : 0.0, "full" : 0.0 }
+
+    @staticmethod
+    def key(c1, c2):
+        """Hash of both circuits, both layouts and the connectivity graph of c2."""
+        h = hashlib.sha256()
+        h.update(c1.to_bytes())
+        h.update(c2.to_bytes())
+        return h.digest()
+
+    def structural_check(self, c1, c2):
+        """
+        Necessary conditions that are cheap to check: both circuits are well
+        typed, and routing added SWAPs but no other gates. Returns an error
+        message, or None.
+        """
+        if not c1.check_well_typed(c1.nqbits) or not c2.check_well_typed(c2.nqbits):
+            return "qubit index out of range"
+        counts1 = dict(c1.gate_stats()["counts"])
+        counts2 = dict(c2.gate_stats()["counts"])
+        if counts2.pop("SWAP", 0) < counts1.pop("SWAP", 0) or counts1 != counts2:
+            return "gate counts differ by more than SWAPs"
+        return None
+
+    def validate(self, c1, c2):
+        """
+        Check that c2, with its layout and connectivity graph set, is a correct
+        mapping of c1 (with its trivial layout). SWAPs in c2 are decomposed on
+        return, and its connectivity constraints are checked for every verdict. Raises VOQCError if validation fails; otherwise returns a dict
+        saying how the verdict was reached ("cached", "full" or "sampled_out")
+        and the time spent.
+        """
+        start = time.perf_counter()
+        error = self.structural_check(c1, c2)
+        key = self.key(c1, c2) if error is None and self.mode != "always" else None
+        structural = time.perf_counter() - start
+        with self.lock:
+            self.counts["validations"] += 1
+            self.times["structural"] += structural
+            if error is not None:
+                self.counts["failures"] += 1
+            elif key in self.verdicts:
+                self.verdicts.move_to_end(key)
+                self.counts["cache_hits"] += 1
+                verdict = "cached"
+            elif self.mode == "sampled" and self.rng.random() >= self.sample_rate:
+                self.counts["sampled_out"] += 1
+                verdict = "sampled_out"
+            else:
+                verdict = "full"
+        if error is not None:
+            raise VOQCError("Circuit mapping validation failed (%s)." % error)
+
+        start = time.perf_counter()
+        if verdict == "full":
+            if c1.check_swap_equivalence(c2) != 1:
+                self._failed(start, verdict)
+                raise VOQCError("Circuit mapping validation failed (input and output are not equivalent).")
+        c2.decompose_swaps()
+        if c2.check_constraints() != 1:
+            self._failed(start, verdict)
+            raise VOQCError("Circuit mapping validation failed (connectivity constraints not satisfied).")
+        full = time.perf_counter() - start
+
+        with self.lock:
+            if verdict == "full":
+                self.counts["full_checks"] += 1
+                self.times["full"] += full
+                if key is not None:
+                    self.verdicts[key] = True
+                    if len(self.verdicts) > self.max_entries:
+                        self.verdicts.popitem(last=False)
+        return { "verdict" : verdict, "structural_time" : structural,
+                 "full_time" : full if verdict == "full" else 0.0 }
+
+    def _failed(self, start, verdict):
+        with self.lock:
+            self.counts["failures"] += 1
+            if verdict == "full":
+                self.counts["full_checks"] += 1
+                self.times["full"] += time.perf_counter() - start
+
+    def stats(self):
+        """Counters and total seconds spent in structural and full checks."""
+        with self.lock:
+            return dict(self.counts, structural_time=self.times["structural"],
+                        full_time=self.times["full"], cached_verdicts=len(self.verdicts))
+
+_default = None
+
+def default_validator():
+    """The process-wide validator (cached mode) used when none is given."""
+    global _default
+    if _default is None:
+        _default = TranslationValidator()
+    return _default
@@ -1,6 +1,11 @@
 from ctypes import *
-import os.path
+from fractions import Fraction
+import functools
+import struct
+import threading
 import time
+from . import profiling
+from .bindings import load_library, CircIntPair, IntIntPair, GateRecord, GATE_NAMES, COUNT_NAMES, PASSES
 
 class VOQCError(Exception):
     def __init__(self, *message):
@@ -9,13 +14,16 @@ class VOQCError(Exception):
     def __str__(self):
         return repr(self.message)
 
-class CircIntPair(Structure):
-    _fields_ = [('circ', c_void_p),
-                ('nqbits', c_int)] 
+def _is_record_array(arr):
+    # NumPy arrays can be passed to C without copying if their layout matches
+    return (hasattr(arr, "ctypes") and arr.flags["C_CONTIGUOUS"]
+            and arr.dtype.names == tuple(f for (f, _) in GateRecord._fields_)
+            and arr.dtype.itemsize == sizeof(GateRecord))
 
-class IntIntPair(Structure):
-    _fields_ = [('x', c_int),
-                ('y', c_int)] 
+def records_to_numpy(records):
+    """View a ctypes GateRecord array as a NumPy structured array (no copy)."""
+    import numpy as np
+    return np.ctypeslib.as_array(records)
 
 def filter_counts(counts):
     cpy = dict()
@@ -24,22 +32,166 @@ def filter_counts(counts):
             cpy[key] = value
     return cpy
 
-# NOTE: This function should only be called once, so it can't be inside the
-# Circuit class initializer, which may be called multiple times. I'm not sure 
-# what the best solution is. -KH
+# The library is loaded and the OCaml runtime initialized only on the first
+# call; later calls return the same handle (see pyvoqc/bindings.py).
 def get_library_handle():
-    # set path and lib
-    rel = os.path.dirname(os.path.abspath(__file__)) # ..
-    lib = CDLL(os.path.join(rel,'lib/libvoqc.so'))
+    return load_library()
 
-    # initialize OCaml code
-    lib.init.argtypes = None
-    lib.init.restype= None
-    lib.init()
+# Header for to_bytes: magic, format version, nqbits, number of gates,
+# layout length, number of coupling map edges (-1 if there is no connectivity
+# graph) and the number of qubits of the connectivity graph. Version 2 added
+# the exact Rzq parameters.
+_BYTES_HEADER = struct.Struct("<4sBxxxiiiii")
+_BYTES_MAGIC = b"VOQC"
+_BYTES_VERSION = 2
 
-    return lib
+GC_STAT_NAMES = ["heap_words", "top_heap_words", "minor_collections", "major_collections",
+                 "compactions", "minor_words", "promoted_words", "major_words"]
+
+def gc_stats(handle=None):
+    """
+    Statistics and parameters of the OCaml garbage collector (sizes are in words).
+    These are cheap to compute: the heap is not traversed.
+    """
+    lib = handle or get_library_handle()
+    buff = (c_long * len(GC_STAT_NAMES))()
+    lib.gc_stats(buff)
+    stats = dict(zip(GC_STAT_NAMES, buff))
+    params = (c_long * 2)()
+    lib.gc_params(params)
+    stats["minor_heap_size"] = params[0]
+    stats["space_overhead"] = params[1]
+    return stats
+
+def gc_tune(minor_heap_size=None, space_overhead=None, handle=None):
+    """
+    Set OCaml GC parameters. A larger minor heap (in words) reduces promotion
+    of short-lived gates during passes; a smaller space_overhead (percent)
+    makes the major GC work harder to keep the heap small. None leaves a
+    parameter unchanged.
+    """
+    lib = handle or get_library_handle()
+    lib.gc_set(minor_heap_size or 0, space_overhead or 0)
+
+def gc_compact(handle=None):
+    """Run a full major GC and compact the OCaml heap."""
+    lib = handle or get_library_handle()
+    lib.gc_compact()
+
+class VOQCConnectivityGraph:
+    '''
+    A connectivity graph held in the OCaml heap. Graphs are immutable, so one
+    graph can be shared by any number of circuits (see VOQCCircuit.use_c_graph);
+    the circuits do not own it. Use cached() to build each device graph once.
+    '''
+    _cache = {}
+
+    def __init__(self, handle, nqbits, coupling_map):
+        self.lib = handle
+        self.nqbits = nqbits
+        self.edges = [tuple(e) for e in coupling_map]
+        arr = (IntIntPair * len(self.edges))(*self.edges)
+        self.ptr = handle.c_graph_from_coupling_map(nqbits, len(self.edges), arr)
+
+    @staticmethod
+    def fingerprint(nqbits, coupling_map):
+        return (nqbits, frozenset(tuple(e) for e in coupling_map))
+
+    @classmethod
+    def cached(cls, handle, nqbits, coupling_map):
+        """Return the graph for this coupling map, building it on first use."""
+        key = cls.fingerprint(nqbits, coupling_map)
+        graph = cls._cache.get(key)
+        if graph is None:
+            graph = cls._cache[key] = cls(handle, nqbits, coupling_map)
+        return graph
+
+    def close(self):
+        if getattr(self, "ptr", None):
+            self.lib.destroy(self.ptr)
+            self.ptr = None
+
+    def __del__(self):
+        self.close()
+
+class VOQCLayout:
+    '''
+    A qubit layout held in the OCaml heap, shareable across circuits like
+    VOQCConnectivityGraph. Trivial layouts are cached by size.
+    '''
+    _trivial = {}
+
+    def __init__(self, handle, ptr, nqbits):
+        self.lib = handle
+        self.ptr = ptr
+        self.nqbits = nqbits
+
+    @classmethod
+    def trivial(cls, handle, nqbits):
+        layout = cls._trivial.get(nqbits)
+        if layout is None:
+            layout = cls._trivial[nqbits] = cls(handle, handle.trivial_layout(nqbits), nqbits)
+        return layout
+
+    @classmethod
+    def from_list(cls, handle, l):
+        arr = (c_int * len(l))(*l)
+        if handle.check_list(len(l), arr) != 1:
+            raise VOQCError("list_to_layout input list is invalid: %s." % l)
+        return cls(handle, handle.list_to_layout(len(l), arr), len(l))
+
+    def close(self):
+        if getattr(self, "ptr", None):
+            self.lib.destroy(self.ptr)
+            self.ptr = None
+
+    def __del__(self):
+        self.close()
+
+# The passes run by optimize_nam (and optimize), from Nam et al. Pipelines
+# with a time budget run these one at a time so they can stop in between.
+NAM_SEQUENCE = ["not_propagation",
+                "hadamard_reduction",
+                "cancel_two_qubit_gates",
+                "cancel_single_qubit_gates",
+                "cancel_two_qubit_gates",
+                "hadamard_reduction",
+                "cancel_single_qubit_gates",
+                "merge_rotations",
+                "cancel_two_qubit_gates",
+                "cancel_single_qubit_gates"]
+
+class CancellationToken:
+    '''
+    Stops a VOQCCircuit pipeline between passes. cancel() may be called from
+    another thread or from a signal handler.
+    '''
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+# Record calls to a VOQCCircuit transform while a Profiler is active
+def _traced(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if profiling._active is None:
+            return method(self, *args, **kwargs)
+        with profiling.stage(method.__name__, self):
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class VOQCCircuit:
+    '''
+    A VOQC circuit, held as a root into the OCaml heap. Every transform releases
+    the root for the old circuit, and close() (or leaving a with block) releases
+    the remaining roots deterministically; a closed circuit cannot be used.
+    '''
     
     # Constructor takes a library handle & qasm file as input
     def __init__(self, handle, fname):
@@ -47,113 +199,450 @@ class VOQCCircuit:
         self.lib = handle
 
         # call read_qasm function and return pointer to a circuit 
-        self.lib.read_qasm.argtypes = [c_char_p]
-        self.lib.read_qasm.restype = CircIntPair      
-        res = self.lib.read_qasm(fname.encode('utf-8'))
+        with profiling.stage("read_qasm") as span:
+            res = self.lib.read_qasm(fname.encode('utf-8'))
+            if not res.circ:
+                raise VOQCError("Failed to read QASM file %s." % fname)
+            self._set_circ(res)
+            span.circuit = self
+
+    # Alternate constructor that parses a QASM program held in memory
+    @classmethod
+    def from_qasm_string(cls, handle, qasm):
+        with profiling.stage("read_qasm_string") as span:
+            buff = qasm.encode('utf-8')
+            res = handle.read_qasm_string(buff, len(buff))
+            if not res.circ:
+                raise VOQCError("Failed to parse QASM string.")
+            obj = cls.__new__(cls)
+            obj.lib = handle
+            obj._set_circ(res)
+            span.circuit = obj
+        return obj
+
+    # Alternate constructor from a sequence of gate records. records may be a
+    # ctypes GateRecord array, a NumPy array with a matching dtype (see
+    # records_to_numpy), or any sequence of (op, q0, q1, q2, a0, a1, a2) tuples.
+    @classmethod
+    def from_records(cls, handle, nqbits, records):
+        buff = records
+        if not (isinstance(records, Array) and records._type_ is GateRecord):
+            if _is_record_array(records):
+                buff = records.ctypes.data_as(POINTER(GateRecord))
+            else:
+                buff = (GateRecord * len(records))(*[GateRecord(*r) for r in records])
+        res = handle.circ_from_records(nqbits, len(records), buff)
+        if not res.circ:
+            raise VOQCError("Invalid gate records for a circuit on %d qubits." % nqbits)
+        obj = cls.__new__(cls)
+        obj.lib = handle
+        obj._set_circ(res)
+        return obj
+
+    def _set_circ(self, res):
         self.circ = res.circ
         self.nqbits = res.nqbits
         
-        # start with an empty layout and connectivity graph
+        # start with an empty layout and connectivity graph. If they were set
+        # from shared objects, these hold the objects and layout/c_graph are
+        # borrowed roots that must not be destroyed.
         self.layout = None
         self.c_graph = None
+        self.shared_layout = None
+        self.shared_c_graph = None
+
+        # (nqbits, edges) for the connectivity graph, which cannot be read back
+        # from OCaml (see to_bytes)
+        self.coupling_map = None
+
+        # number of leading gates already optimized (see optimize_incremental)
+        self.optimized_prefix = 0
         
+    @property
+    def circ(self):
+        if self._circ is None:
+            raise VOQCError("Cannot use a closed circuit.")
+        return self._circ
+
+    # Any new gate list invalidates the optimized prefix; append and
+    # optimize_incremental set it again afterwards
+    @circ.setter
+    def circ(self, root):
+        self._circ = root
+        self.optimized_prefix = 0
+
+    @property
+    def closed(self):
+        return getattr(self, "_circ", None) is None
+
+    def close(self):
+        # free OCaml roots (the constructor may have failed before setting them)
+        if getattr(self, "_circ", None):
+            self.lib.destroy(self._circ)
+            self._circ = None
+        if getattr(self, "layout", None):
+            self._release_layout()
+        if getattr(self, "c_graph", None):
+            self._release_c_graph()
+
+    def _release_layout(self):
+        if self.layout and self.shared_layout is None:
+            self.lib.destroy(self.layout)
+        self.layout = None
+        self.shared_layout = None
+
+    def _release_c_graph(self):
+        if self.c_graph and self.shared_c_graph is None:
+            self.lib.destroy(self.c_graph)
+        self.c_graph = None
+        self.shared_c_graph = None
+        self.coupling_map = None
+
     # Destructor
     def __del__(self):
-        # free OCaml root
-        self.lib.destroy.argtypes = [c_void_p]
-        self.lib.destroy.restype = None
-        self.lib.destroy(self.circ) 
-        if self.layout: self.lib.destroy(self.layout)
-        if self.c_graph: self.lib.destroy(self.c_graph)   
+        self.close()
 
-    def write(self, fname):
+    def __enter__(self):
+        return self
 
-        # define function argtype/restype to match C
-        self.lib.write_qasm.argtypes = [c_void_p, c_int, c_char_p]
-        self.lib.write_qasm.restype = None
-                
+    def __exit__(self, *exc):
+        self.close()
+
+    # Returns an independent circuit. OCaml values are immutable, so this only
+    # registers new roots for the same gate list, layout and connectivity graph.
+    def copy(self):
+        obj = self._wrap(self.lib.copy_root(self.circ))
+        if self.shared_layout is not None: obj.use_layout(self.shared_layout)
+        elif self.layout: obj.layout = self.lib.copy_root(self.layout)
+        if self.shared_c_graph is not None: obj.use_c_graph(self.shared_c_graph)
+        elif self.c_graph:
+            obj.c_graph = self.lib.copy_root(self.c_graph)
+            obj.coupling_map = self.coupling_map
+        obj.optimized_prefix = self.optimized_prefix
+        return obj
+
+    # New circuit on the same qubits that owns the given root
+    def _wrap(self, root):
+        obj = self.__class__.__new__(self.__class__)
+        obj.lib = self.lib
+        obj._set_circ(CircIntPair(root, self.nqbits))
+        return obj
+
+    # Replace this circuit's gates with those of other, taking over its root
+    def _take(self, other):
+        self.lib.destroy(self.circ)
+        self.circ = other.circ
+        other._circ = None
+
+    def append(self, gates):
+        """
+        Append gates to the end of this circuit. gates may be a VOQCCircuit (which
+        is not modified), a QASM string, or gate records as accepted by from_records.
+        """
+        if isinstance(gates, VOQCCircuit):
+            other = gates.copy()
+        elif isinstance(gates, str):
+            other = VOQCCircuit.from_qasm_string(self.lib, gates)
+        else:
+            other = VOQCCircuit.from_records(self.lib, self.nqbits, gates)
+        with other:
+            if other.nqbits > self.nqbits:
+                raise VOQCError("Cannot append a circuit on %d qubits to a circuit on %d qubits." % (other.nqbits, self.nqbits))
+            res = self.lib.circ_append(self.circ, other.circ)
+        self.lib.destroy(self.circ)
+        prefix = self.optimized_prefix
+        self.circ = res
+        # the existing gates are unchanged
+        self.optimized_prefix = prefix
+        return self
+
+    @_traced
+    def optimize_incremental(self, passes=("optimize",), window=100):
+        """
+        Apply passes to the gates added since the last call plus the last window
+        gates of the already-optimized prefix, then mark the whole circuit as
+        optimized. The re-optimized suffix gets exactly the result of a full run
+        on that suffix; earlier gates are left untouched, so a new gate is never
+        combined with one more than window gates before it. The first call
+        optimizes the whole circuit.
+        """
+        n = self.total_gate_count()
+        if self.optimized_prefix >= n:
+            return self
+        cut = max(0, self.optimized_prefix - window)
+        with self._wrap(self.lib.circ_drop(self.circ, cut)) as tail:
+            tail.run_pipeline(list(passes))
+            prefix = self.lib.circ_take(self.circ, cut)
+            res = self.lib.circ_append(prefix, tail.circ)
+            self.lib.destroy(prefix)
+        self.lib.destroy(self.circ)
+        self.circ = res
+        self.optimized_prefix = self.total_gate_count()
+        return self
+
+    @_traced
+    def run_pipeline(self, passes, until_fixpoint=False, max_rounds=None, time_budget=None, cancel=None):
+        """
+        Apply a sequence of passes, given by name (e.g. ["optimize_nam", "replace_rzq"]),
+        in a single call into VOQC. With until_fixpoint, the sequence is repeated
+        until the gate count stops decreasing or max_rounds rounds have run.
+        The number of rounds run is stored in self.pipeline_rounds. While a
+        Profiler with per_pass set is active, passes are applied one call at a
+        time (except with until_fixpoint) so each gets its own span.
+
+        With a time_budget (in seconds) or a CancellationToken, passes run one
+        call at a time (optimize and optimize_nam are expanded to NAM_SEQUENCE)
+        and the pipeline stops before the next pass once the budget is spent or
+        the token is cancelled. A pass that has started always runs to the end.
+        If stopped early, the circuit is the intermediate result with the fewest
+        gates. self.completed_passes lists the passes that ran and
+        self.pipeline_complete tells whether the pipeline finished.
+        """
+        for p in passes:
+            if not (p in PASSES):
+                raise VOQCError("Invalid VOQC pass %s." % p)
+        if time_budget is not None or cancel is not None:
+            return self._run_bounded(passes, until_fixpoint, max_rounds, time_budget, cancel)
+        prof = profiling._active
+        if prof is not None and prof.per_pass and not until_fixpoint:
+            # one call per pass, so that each pass is recorded separately
+            for p in passes:
+                getattr(self, p)()
+            self.pipeline_rounds = 1
+            self.completed_passes = list(passes)
+            self.pipeline_complete = True
+            return self
+        names = (c_char_p * len(passes))(*[p.encode('utf-8') for p in passes])
+        rounds = c_int(0)
+        self.circ = self.lib.run_pipeline(self.circ, len(passes), names, int(until_fixpoint),
+                                          max_rounds or 0, byref(rounds))
+        self.pipeline_rounds = rounds.value
+        self.completed_passes = list(passes) * rounds.value
+        self.pipeline_complete = True
+        return self
+
+    @_traced
+    def _run_bounded(self, passes, until_fixpoint, max_rounds, time_budget, cancel):
+        steps = []
+        for p in passes:
+            steps += NAM_SEQUENCE if p in ("optimize", "optimize_nam") else [p]
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        self.completed_passes = []
+        self.pipeline_complete = False
+        self.pipeline_rounds = 0
+        best = None # root of an earlier, smaller circuit, if the current one is larger
+        best_n = self.total_gate_count()
+        try:
+            while True:
+                start_n = self.total_gate_count()
+                for p in steps:
+                    if (cancel is not None and cancel.cancelled) or \
+                       (deadline is not None and time.monotonic() >= deadline):
+                        if best is not None:
+                            (self.circ, best) = (best, self.circ)
+                        return self
+                    keep = self.lib.copy_root(self.circ) if best is None else None
+                    getattr(self, p)()
+                    self.completed_passes.append(p)
+                    n = self.total_gate_count()
+                    if n <= best_n:
+                        best_n = n
+                        for root in (best, keep):
+                            if root is not None: self.lib.destroy(root)
+                        best = None
+                    elif keep is not None:
+                        best = keep
+                self.pipeline_rounds += 1
+                if not until_fixpoint or self.total_gate_count() >= start_n \
+                   or (max_rounds and self.pipeline_rounds >= max_rounds):
+                    self.pipeline_complete = True
+                    return self
+        finally:
+            if best is not None:
+                self.lib.destroy(best)
+
+    def plan(self, *passes):
+        """Start a lazy PassPlan for this circuit (see pyvoqc/plan.py)."""
+        from .plan import PassPlan
+        return PassPlan(self, passes)
+
+    def apply_passes(self, passes, cache=None, until_fixpoint=False, max_rounds=None, time_budget=None, cancel=None):
+        """
+        Like run_pipeline, but if cache is an OptimizationCache, a hit replaces
+        the circuit with the cached result without calling into VOQC, and a
+        miss stores the result (unless the pipeline was stopped early).
+        """
+        if cache is not None:
+            settings = list(passes)
+            if until_fixpoint:
+                settings += ["fixpoint", max_rounds or 0]
+            key = cache.key(self, settings)
+            data = cache.get(key)
+            if data is not None:
+                self._take(VOQCCircuit.from_bytes(self.lib, data))
+                self.completed_passes = list(passes)
+                self.pipeline_complete = True
+                return self
+        self.run_pipeline(passes, until_fixpoint, max_rounds, time_budget, cancel)
+        if cache is not None and self.pipeline_complete:
+            cache.put(key, self.to_bytes())
+        return self
+
+    @_traced
+    def to_bytes(self):
+        """
+        Compact binary encoding of the circuit, its layout and its connectivity
+        graph: a header, the raw gate records, the layout as a list, the
+        coupling map edges and the exact Rzq parameters (the records only hold
+        them as floats). Load it with from_bytes; VOQCCircuits are also
+        picklable through this encoding.
+        """
+        records = self.to_records()
+        layout = self.layout_to_list() if self.layout else []
+        (gnq, edges) = self.coupling_map or (0, [])
+        header = _BYTES_HEADER.pack(_BYTES_MAGIC, _BYTES_VERSION, self.nqbits, len(records),
+                                    len(layout), -1 if self.coupling_map is None else len(edges), gnq)
+        return b"".join([header, bytes(records), bytes((c_int * len(layout))(*layout)),
+                         bytes((IntIntPair * len(edges))(*edges)), self._rzq_text()])
+
+    @classmethod
+    def from_bytes(cls, handle, data):
+        obj = cls.__new__(cls)
+        obj._load_bytes(handle, data)
+        return obj
+
+    def _load_bytes(self, handle, data):
+        try:
+            (magic, version, nqbits, n, nlayout, nedges, gnq) = _BYTES_HEADER.unpack_from(data)
+        except struct.error:
+            raise VOQCError("Invalid VOQC circuit encoding.")
+        if magic != _BYTES_MAGIC or version != _BYTES_VERSION:
+            raise VOQCError("Invalid VOQC circuit encoding.")
+        off = _BYTES_HEADER.size
+        records = (GateRecord * n).from_buffer_copy(data, off)
+        off += sizeof(records)
+        res = handle.circ_from_records(nqbits, n, records)
+        if not res.circ:
+            raise VOQCError("Invalid gate records for a circuit on %d qubits." % nqbits)
+        self.lib = handle
+        self._set_circ(res)
+        if nlayout:
+            arr = (c_int * nlayout).from_buffer_copy(data, off)
+            if handle.check_list(nlayout, arr) != 1:
+                raise VOQCError("Invalid VOQC circuit encoding.")
+            self.layout = handle.list_to_layout(nlayout, arr)
+            off += sizeof(arr)
+        if nedges >= 0:
+            arr = (IntIntPair * nedges).from_buffer_copy(data, off)
+            off += sizeof(arr)
+            graph = VOQCConnectivityGraph.cached(handle, gnq, [(e.x, e.y) for e in arr])
+            (self.c_graph, self.shared_c_graph, self.coupling_map) = (graph.ptr, graph, (gnq, graph.edges))
+        # replace the float Rzq parameters of the records with the exact ones
+        text = bytes(data[off:])
+        if text:
+            res = handle.set_rzq_params(self.circ, text, len(text))
+            if not res:
+                raise VOQCError("Invalid VOQC circuit encoding.")
+            handle.destroy(self.circ)
+            self.circ = res
+
+    def __getstate__(self):
+        return { "data" : self.to_bytes() }
+
+    def __setstate__(self, state):
+        self._load_bytes(get_library_handle(), state["data"])
+
+    def write(self, fname):
         # write qasm file
         self.lib.write_qasm(self.circ, self.nqbits, fname.encode('utf-8'))
 
+    @_traced
+    def to_qasm_string(self):
+        # the returned buffer is owned by the C code, so copy it before freeing
+        n = c_int(0)
+        buff = self.lib.write_qasm_string(self.circ, self.nqbits, byref(n))
+        if not buff:
+            raise VOQCError("Failed to write QASM string.")
+        try:
+            return string_at(buff, n.value).decode('utf-8')
+        finally:
+            self.lib.free_buffer(buff)
+
+    def _rzq_text(self):
+        n = c_int(0)
+        buff = self.lib.rzq_params(self.circ, byref(n))
+        if not buff:
+            raise VOQCError("Failed to read Rzq parameters.")
+        try:
+            return string_at(buff, n.value)
+        finally:
+            self.lib.free_buffer(buff)
+
+    def rzq_params(self):
+        """Exact parameters q of the Rzq gates (Rz(q * PI)), in circuit order, as Fractions."""
+        return [Fraction(q) for q in self._rzq_text().decode("ascii").split()]
+
+    def to_records(self):
+        n = self.total_gate_count()
+        records = (GateRecord * n)()
+        if self.lib.circ_to_records(self.circ, n, records) != n:
+            raise VOQCError("Failed to convert circuit to gate records.")
+        return records
+
+    def to_numpy(self):
+        return records_to_numpy(self.to_records())
+
+    # All gate statistics from a single traversal of the circuit
+    def gate_stats(self):
+        buff = (c_int * (len(COUNT_NAMES) + 2))()
+        self.lib.count_all(self.circ, buff)
+        return { "counts" : filter_counts(dict(zip(COUNT_NAMES, buff))),
+                 "total" : buff[len(COUNT_NAMES)],
+                 "rzq_clifford" : buff[len(COUNT_NAMES) + 1] }
+
+    def analyze(self, as_numpy=False):
+        """
+        Structural metrics from a single native traversal of the circuit:
+        depth, multi-qubit depth, per-qubit gate counts, multi-qubit gate counts
+        and depths, the indices (into to_records()) of the gates on one critical
+        path, and the two-qubit interaction graph as (q1, q2, count) edges.
+        With as_numpy, arrays are returned as NumPy int arrays (edges with
+        shape (n, 3)) that share one buffer.
+        """
+        n = c_int(0)
+        arr = self.lib.analyze(self.circ, self.nqbits, byref(n))
+        buff = (c_int * n.value)()
+        self.lib.blit_ints(arr, buff)
+        self.lib.destroy(arr)
+        if as_numpy:
+            import numpy as np
+            buff = np.ctypeslib.as_array(buff)
+        (nq, depth, depth2, ncrit, nedges) = [int(x) for x in buff[:5]]
+        off = [5 + i * nq for i in range(4)]
+        edges = buff[off[3] + ncrit:off[3] + ncrit + 3 * nedges]
+        return { "depth" : depth,
+                 "multi_qubit_depth" : depth2,
+                 "critical_path_length" : ncrit,
+                 "qubit_gate_counts" : buff[off[0]:off[1]],
+                 "qubit_multi_qubit_counts" : buff[off[1]:off[2]],
+                 "qubit_depths" : buff[off[2]:off[3]],
+                 "critical_path" : buff[off[3]:off[3] + ncrit],
+                 "interaction_edges" : edges.reshape(-1, 3) if as_numpy
+                                       else [tuple(edges[i:i + 3]) for i in range(0, len(edges), 3)] }
+
     def count_gates(self):        
-        self.lib.count_I.argtypes = [c_void_p]
-        self.lib.count_I.restype = c_int
-        self.lib.count_X.argtypes = [c_void_p]
-        self.lib.count_X.restype = c_int
-        self.lib.count_Y.argtypes = [c_void_p]
-        self.lib.count_Y.restype = c_int
-        self.lib.count_Z.argtypes = [c_void_p]
-        self.lib.count_Z.restype = c_int
-        self.lib.count_H.argtypes = [c_void_p]
-        self.lib.count_H.restype = c_int
-        self.lib.count_S.argtypes = [c_void_p]
-        self.lib.count_S.restype = c_int
-        self.lib.count_T.argtypes = [c_void_p]
-        self.lib.count_T.restype = c_int
-        self.lib.count_Sdg.argtypes = [c_void_p]
-        self.lib.count_Sdg.restype = c_int
-        self.lib.count_Tdg.argtypes = [c_void_p]
-        self.lib.count_Tdg.restype = c_int
-        self.lib.count_Rx.argtypes = [c_void_p]
-        self.lib.count_Rx.restype = c_int
-        self.lib.count_Ry.argtypes = [c_void_p]
-        self.lib.count_Ry.restype = c_int
-        self.lib.count_Rz.argtypes = [c_void_p]
-        self.lib.count_Rz.restype = c_int
-        self.lib.count_Rzq.argtypes = [c_void_p]
-        self.lib.count_Rzq.restype = c_int
-        self.lib.count_U1.argtypes = [c_void_p]
-        self.lib.count_U1.restype = c_int
-        self.lib.count_U2.argtypes = [c_void_p]
-        self.lib.count_U2.restype = c_int
-        self.lib.count_U3.argtypes = [c_void_p]
-        self.lib.count_U3.restype = c_int
-        self.lib.count_CX.argtypes = [c_void_p]
-        self.lib.count_CX.restype = c_int
-        self.lib.count_CZ.argtypes = [c_void_p]
-        self.lib.count_CZ.restype = c_int
-        self.lib.count_SWAP.argtypes = [c_void_p]
-        self.lib.count_SWAP.restype = c_int
-        self.lib.count_CCX.argtypes = [c_void_p]
-        self.lib.count_CCX.restype = c_int
-        self.lib.count_CCZ.argtypes = [c_void_p]
-        self.lib.count_CCZ.restype = c_int
-        cnts = { "I" : self.lib.count_I(self.circ),
-                 "X" : self.lib.count_X(self.circ),
-                 "Y" : self.lib.count_Y(self.circ),
-                 "Z" : self.lib.count_Z(self.circ),
-                 "H" : self.lib.count_H(self.circ),
-                 "S" : self.lib.count_S(self.circ),
-                 "T" : self.lib.count_T(self.circ),
-                 "Sdg" : self.lib.count_Sdg(self.circ),
-                 "Tdg" : self.lib.count_Tdg(self.circ),
-                 "Rx" : self.lib.count_Rx(self.circ),
-                 "Ry" : self.lib.count_Ry(self.circ),
-                 "Rz" : self.lib.count_Rz(self.circ),
-                 "Rzq" : self.lib.count_Rzq(self.circ),
-                 "U1" : self.lib.count_U1(self.circ),
-                 "U2" : self.lib.count_U2(self.circ),
-                 "U3" : self.lib.count_U3(self.circ),
-                 "CX" : self.lib.count_CX(self.circ),
-                 "CZ" : self.lib.count_CZ(self.circ),
-                 "SWAP" : self.lib.count_SWAP(self.circ),
-                 "CCX" : self.lib.count_CCX(self.circ),
-                 "CCZ" : self.lib.count_CCZ(self.circ) }
-        return filter_counts(cnts)
+        return self.gate_stats()["counts"]
 
     def count_rzq_clifford(self):
-        self.lib.count_rzq_clifford.argtypes = [c_void_p]
-        self.lib.count_rzq_clifford.restype = c_int
         return self.lib.count_rzq_clifford(self.circ)
 
     def total_gate_count(self):
-        self.lib.count_total.argtypes = [c_void_p]
-        self.lib.count_total.restype = c_int
         return self.lib.count_total(self.circ)
 
     def print_info(self):
-        print("Circuit uses %d qubits and %d gates." % (self.nqbits,self.total_gate_count()))
-        print(self.count_gates())
+        stats = self.gate_stats()
+        print("Circuit uses %d qubits and %d gates." % (self.nqbits,stats["total"]))
+        print(stats["counts"])
         if self.layout:
             l = self.layout_to_list()
             print("Current layout is [%s]" % ",".join([str(i) for i in l]))
@@ -163,88 +652,80 @@ class VOQCCircuit:
     def check_well_typed(self, nqbits):
         if nqbits != self.nqbits:
             print("Warning: the provided value of nqbits was %d, but the value of self.nqbits is %d." % (nqbits, self.nqbits))
-        self.lib.check_well_typed.argtypes = [c_void_p, c_int]
-        self.lib.check_well_typed.restype = c_int
         return (self.lib.check_well_typed(self.circ, nqbits) == 1)
 
+    @_traced
     def convert_to_rzq(self):        
-        self.lib.convert_to_rzq.argtypes = [c_void_p]
-        self.lib.convert_to_rzq.restype = c_void_p
         self.circ = self.lib.convert_to_rzq(self.circ)
         return self
 
+    @_traced
     def convert_to_ibm(self):        
-        self.lib.convert_to_ibm.argtypes = [c_void_p]
-        self.lib.convert_to_ibm.restype = c_void_p
         self.circ = self.lib.convert_to_ibm(self.circ)
         return self
 
+    @_traced
     def decompose_to_cnot(self):        
-        self.lib.decompose_to_cnot.argtypes = [c_void_p]
-        self.lib.decompose_to_cnot.restype = c_void_p
         self.circ = self.lib.decompose_to_cnot(self.circ)
         return self
         
+    @_traced
     def replace_rzq(self):        
-        self.lib.replace_rzq.argtypes = [c_void_p]
-        self.lib.replace_rzq.restype = c_void_p
         self.circ = self.lib.replace_rzq(self.circ)
         return self
 
+    @_traced
     def optimize_ibm(self):        
-        self.lib.optimize_ibm.argtypes = [c_void_p]
-        self.lib.optimize_ibm.restype = c_void_p
         self.circ = self.lib.optimize_ibm(self.circ)
         return self
 
+    @_traced
     def not_propagation(self):        
-        self.lib.not_propagation.argtypes = [c_void_p]
-        self.lib.not_propagation.restype = c_void_p
         self.circ = self.lib.not_propagation(self.circ)
         return self
     
+    @_traced
     def hadamard_reduction(self):        
-        self.lib.hadamard_reduction.argtypes = [c_void_p]
-        self.lib.hadamard_reduction.restype = c_void_p
         self.circ = self.lib.hadamard_reduction(self.circ)
         return self
         
+    @_traced
     def cancel_single_qubit_gates(self):        
-        self.lib.cancel_single_qubit_gates.argtypes = [c_void_p]
-        self.lib.cancel_single_qubit_gates.restype = c_void_p
         self.circ = self.lib.cancel_single_qubit_gates(self.circ)
         return self
         
+    @_traced
     def cancel_two_qubit_gates(self):        
-        self.lib.cancel_two_qubit_gates.argtypes = [c_void_p]
-        self.lib.cancel_two_qubit_gates.restype = c_void_p
         self.circ = self.lib.cancel_two_qubit_gates(self.circ)
         return self
         
+    @_traced
     def merge_rotations(self):        
-        self.lib.merge_rotations.argtypes = [c_void_p]
-        self.lib.merge_rotations.restype = c_void_p
         self.circ = self.lib.merge_rotations(self.circ)
         return self
         
+    @_traced
     def optimize_nam(self):        
-        self.lib.optimize_nam.argtypes = [c_void_p]
-        self.lib.optimize_nam.restype = c_void_p
         self.circ = self.lib.optimize_nam(self.circ)
         return self
 
-    def optimize(self):        
-        self.lib.optimize.argtypes = [c_void_p]
-        self.lib.optimize.restype = c_void_p
+    @_traced
+    def optimize(self, time_budget=None, cancel=None):
+        """
+        Run the Nam optimizations. With a time_budget (in seconds) or a
+        CancellationToken this is run_pipeline(["optimize"], ...), which may
+        stop between passes (see run_pipeline).
+        """
+        if time_budget is not None or cancel is not None:
+            return self.run_pipeline(["optimize"], time_budget=time_budget, cancel=cancel)
         self.circ = self.lib.optimize(self.circ)
         return self
     
+    @_traced
     def decompose_swaps(self):
         if not self.c_graph: 
             raise VOQCError("Cannot apply decompose_swaps. Connectivity graph is not set.")
         else:
-            self.lib.decompose_swaps.argtypes = [c_void_p, c_void_p]
-            self.lib.decompose_swaps.restype = c_void_p
             self.circ = self.lib.decompose_swaps(self.circ, self.c_graph)    
             return self
 
@@ -252,8 +733,7 @@ class VOQCCircuit:
         if self.nqbits > nqbits:
             raise VOQCError("The layout is too small. It must contain at least %d qubits." % self.nqbits)
         else:
-            self.lib.trivial_layout.argtypes = [c_int]
-            self.lib.trivial_layout.restype = c_void_p 
+            self._release_layout()
             self.layout = self.lib.trivial_layout(nqbits)
             self.nqbits = nqbits
             
@@ -262,45 +742,83 @@ class VOQCCircuit:
             raise VOQCError("The layout is too small. The layout must contain at least %d qubits." % self.nqbits)
         else:
             arr = (c_int * len(l))(*l)
-            self.lib.check_list.argtypes = [c_int, POINTER(c_int)]
-            self.lib.check_list.restype = c_int
             if self.lib.check_list(len(l), arr) == 1:
-                self.lib.list_to_layout.argtypes = [c_int, POINTER(c_int)]
-                self.lib.list_to_layout.restype = c_void_p 
+                self._release_layout()
                 self.layout = self.lib.list_to_layout(len(l), arr)
                 self.nqbits = len(l)
             else:
                 raise VOQCError("list_to_layout input list is invalid: %s." % l)
 
+    def use_layout(self, layout):
+        """Use a shared VOQCLayout (e.g. VOQCLayout.trivial) without copying it."""
+        if self.nqbits > layout.nqbits:
+            raise VOQCError("The layout is too small. It must contain at least %d qubits." % self.nqbits)
+        self._release_layout()
+        self.layout = layout.ptr
+        self.shared_layout = layout
+        self.nqbits = layout.nqbits
+
     def c_graph_from_coupling_map(self, nqbits, coupling_map):
         if self.nqbits > nqbits:
             raise VOQCError("The coupling map is too small. The connectivity graph must contain at least %d qubits." % self.nqbits)
-        self.lib.destroy.argtypes = [c_void_p]
-        self.lib.destroy.restype = None
         if self.c_graph:
             print("Warning: Deleting old connectivity graph.")
-            self.lib.destroy(self.c_graph)
-        arr = (IntIntPair * len(coupling_map))()
-        for i in range(len(coupling_map)):
-            arr[i].x = coupling_map[i][0]
-            arr[i].y = coupling_map[i][1]
-        self.lib.c_graph_from_coupling_map.argtypes = [c_int, c_int, POINTER(IntIntPair)]
-        self.lib.c_graph_from_coupling_map.restype = c_void_p 
+            self._release_c_graph()
+        arr = (IntIntPair * len(coupling_map))(*[tuple(e) for e in coupling_map])
         self.c_graph = self.lib.c_graph_from_coupling_map(nqbits, len(coupling_map), arr)
+        self.coupling_map = (nqbits, [tuple(e) for e in coupling_map])
         self.nqbits = nqbits
 
+    def use_c_graph(self, graph):
+        """Use a shared VOQCConnectivityGraph without copying it."""
+        if self.nqbits > graph.nqbits:
+            raise VOQCError("The coupling map is too small. The connectivity graph must contain at least %d qubits." % self.nqbits)
+        self._release_c_graph()
+        self.c_graph = graph.ptr
+        self.shared_c_graph = graph
+        self.coupling_map = (graph.nqbits, graph.edges)
+        self.nqbits = graph.nqbits
+
+    def layout_to_list(self):
+        if not self.layout:
+            raise VOQCError("Cannot apply layout_to_list. Layout is not set.")
+        buff = (c_int * self.nqbits)()
+        self.lib.layout_to_list(self.layout, self.nqbits, buff)
+        return list(buff)
+
+    def greedy_layout(self):
+        if not self.c_graph:
+            raise VOQCError("Cannot apply greedy_layout. Connectivity graph is not set.")
+        layout = self.lib.greedy_layout(self.circ, self.c_graph)
+        self._release_layout()
+        self.layout = layout
+
+    @_traced
+    def simple_map(self):
+        """
+        Map the circuit onto the connectivity graph with VOQC's verified router,
+        starting from the current layout (trivial if none is set). The result
+        satisfies the connectivity constraints once SWAPs are decomposed (see
+        decompose_swaps), and the layout is replaced by the final layout.
+        """
+        if not self.c_graph:
+            raise VOQCError("Cannot apply simple_map. Connectivity graph is not set.")
+        if not self.layout:
+            self.trivial_layout(self.nqbits)
+        final = c_void_p()
+        self.circ = self.lib.simple_map(self.circ, self.layout, self.c_graph, byref(final))
+        self._release_layout()
+        self.layout = final.value
+        return self
+
     def check_swap_equivalence(self, obj):
         if not self.layout or not obj.layout: 
             raise VOQCError("Cannot apply check_swap_equivalence. Input layouts are not set.")
-        self.lib.check_swap_equivalence.argtypes = [c_void_p, c_void_p, c_void_p, c_void_p]
-        self.lib.check_swap_equivalence.restype = c_int
         return (self.lib.check_swap_equivalence(self.circ, obj.circ, self.layout, obj.layout) == 1)
 
     def check_constraints(self):
         if not self.c_graph:
             raise VOQCError("Cannot apply check_constraints. Connectivity graph is not set.")
         else:
-            self.lib.check_constraints.argtypes = [c_void_p, c_void_p]
-            self.lib.check_constraints.restype = c_int
             return (self.lib.check_constraints(self.circ, self.c_graph) == 1)
 